@@ -1,16 +1,27 @@
 from typing import Optional, Dict, Any
 import json
 import hashlib
-from redis import Redis
+import uuid
+from redis.asyncio import Redis
+from app.core.config import settings
+
+# Deletes the in-progress marker only while it still holds the caller's token
+RELEASE_IN_PROGRESS_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
 
 
 class RedisCache:
     def __init__(self, redis_client: Redis):
         self.redis = redis_client
-        self.request_cache_ttl = 3600  # 1 hour
+        self.request_cache_ttl = settings.CACHE_TTL
+        self.in_progress_ttl = settings.LOCK_TIMEOUT
 
-    def get_cached_request(self, request_id: str) -> Optional[Dict[str, Any]]:
-        cached = self.redis.hgetall(f"request:{request_id}")
+    async def get_cached_request(self, request_id: str) -> Optional[Dict[str, Any]]:
+        cached = await self.redis.hgetall(f"request:{request_id}")
         if not cached:
             return None
 
@@ -26,13 +37,36 @@ class RedisCache:
         sorted_data = json.dumps(data, sort_keys=True)
         return hashlib.sha256(sorted_data.encode()).hexdigest()
 
-    def cache_request(self, request_id: str, request_data: Dict[str, Any]) -> None:
+    async def cache_request(self, request_id: str, request_data: Dict[str, Any]) -> None:
         request_hash = self.generate_request_hash(request_data)
-        self.redis.hset(
+        await self.redis.hset(
             f"request:{request_id}",
             mapping={
                 "hash": request_hash,
                 "data": json.dumps(request_data)
             }
         )
-        self.redis.expire(f"request:{request_id}", self.request_cache_ttl)
+        await self.redis.expire(f"request:{request_id}", self.request_cache_ttl)
+
+    async def mark_request_in_progress(self, request_id: str) -> Optional[str]:
+        """Takes the marker and returns the owner token, or None if it is taken."""
+        token = uuid.uuid4().hex
+        acquired = await self.redis.set(
+            f"request:{request_id}:in_progress",
+            token,
+            nx=True,
+            ex=self.in_progress_ttl
+        )
+        return token if acquired else None
+
+    async def is_request_in_progress(self, request_id: str) -> bool:
+        return bool(await self.redis.exists(f"request:{request_id}:in_progress"))
+
+    async def clear_request_in_progress(self, request_id: str, token: str) -> bool:
+        # The marker may have expired and been taken by another owner meanwhile
+        return bool(await self.redis.eval(
+            RELEASE_IN_PROGRESS_SCRIPT,
+            1,
+            f"request:{request_id}:in_progress",
+            token
+        ))
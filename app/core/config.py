@@ -1,6 +1,6 @@
 from pydantic_settings import BaseSettings
 from functools import lru_cache
-from typing import Optional
+from typing import Dict, Optional
 
 
 class Settings(BaseSettings):
@@ -16,13 +16,36 @@ class Settings(BaseSettings):
     DB_POOL_SIZE: int = 5
     DB_MAX_OVERFLOW: int = 10
     DB_POOL_TIMEOUT: int = 30
+    DB_ECHO: bool = False
+
+    # Shard name -> database URL; empty means a single unsharded database
+    SHARD_DATABASE_URLS: Dict[str, str] = {}
+    SHARD_SLOT_COUNT: int = 1024
+    SHARD_MAP_PATH: Optional[str] = None
+    SHARD_MAP_RELOAD_INTERVAL: float = 1.0  # seconds between checks of SHARD_MAP_PATH
+    # A worker that has not acknowledged a map for this long is treated as gone
+    SHARD_MAP_ACK_TTL: int = 30  # seconds
+    SHARD_MAP_ACK_TIMEOUT: int = 300  # seconds the rebalancer waits for workers
 
     API_V1_PREFIX: str = "/api/v1"
     BOOKING_TIMEOUT: int = 300  # 5 minutes
     MAX_RETRIES: int = 3
     RETRY_DELAY: int = 1
 
-    LOCK_TIMEOUT: int = 10  # seconds
+    # In-progress marker TTL; kept above COALESCE_WAIT_TIMEOUT so a slow
+    # booking keeps its marker for as long as anyone may wait on it
+    LOCK_TIMEOUT: int = 30  # seconds
+    COALESCE_WAIT_TIMEOUT: int = 10  # seconds
+    COALESCE_POLL_INTERVAL: float = 0.05  # seconds
+
+    RETENTION_ENABLED: bool = True
+    RETENTION_INTERVAL: int = 300  # seconds between archiver runs
+    # Never shorter than CACHE_TTL, so cached duplicates can still find their response
+    BOOKING_RESPONSE_RETENTION: int = 86400  # 1 day
+    BOOKING_RESPONSE_PARTITIONS_AHEAD: int = 3  # days
+    CANCELLED_TICKET_RETENTION: int = 2592000  # 30 days
+    ARCHIVE_BATCH_SIZE: int = 500
+    ARCHIVE_BATCH_PAUSE: float = 0.1  # seconds between batches
 
     class Config:
         env_file = ".env"
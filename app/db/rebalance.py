@@ -0,0 +1,233 @@
+"""Moves a range of hash slots, and the rows that hash into it, to another shard.
+
+Usage:
+    python -m app.db.rebalance --start 0 --end 256 --target shard_b
+
+The shard map is read from and written back to ``SHARD_MAP_PATH``. Rows are
+only deleted from the old owners once every running worker has acknowledged
+the new map version in Redis (see ShardMapWatcher).
+"""
+from typing import AsyncIterator, Awaitable, Callable, Dict, Optional, Set
+import argparse
+import asyncio
+import logging
+import redis.asyncio as redis
+from sqlalchemy import delete
+from sqlalchemy.future import select
+from sqlalchemy.orm import sessionmaker
+from app.core.config import settings
+from app.db.sharding import ShardMap, create_shard_sessions, get_shard_map, wait_for_shard_map_acknowledgements
+from app.models.ticket import Ticket, BookingRequestKey, BookingResponse
+
+logger = logging.getLogger(__name__)
+
+# model -> (column scanned in batches, column the shard map routes on, row identity)
+SHARDED_MODELS = {
+    Ticket: (Ticket.id, Ticket.seat_number, Ticket.booking_reference),
+    BookingResponse: (BookingResponse.request_id, BookingResponse.request_id, BookingResponse.request_id),
+    BookingRequestKey: (BookingRequestKey.request_id, BookingRequestKey.request_id, BookingRequestKey.request_id),
+}
+
+
+async def _iter_slot_rows(
+        model,
+        source: sessionmaker,
+        shard_map: ShardMap,
+        start: int,
+        end: int,
+        batch_size: int
+) -> AsyncIterator[list]:
+    scan_column, route_column, _ = SHARDED_MODELS[model]
+    last = None
+
+    while True:
+        async with source() as source_session:
+            query = select(model).order_by(scan_column).limit(batch_size)
+            if last is not None:
+                query = query.where(scan_column > last)
+            rows = (await source_session.execute(query)).scalars().all()
+        if not rows:
+            return
+        last = getattr(rows[-1], scan_column.key)
+
+        rows = [
+            row for row in rows
+            if start <= shard_map.slot_for_key(getattr(row, route_column.key)) < end
+        ]
+        if rows:
+            yield rows
+
+
+async def _copy_rows(
+        model,
+        source: sessionmaker,
+        target: sessionmaker,
+        shard_map: ShardMap,
+        start: int,
+        end: int,
+        batch_size: int
+) -> int:
+    _, _, identity_column = SHARDED_MODELS[model]
+    # Ticket ids are shard-local, so the target assigns new ones
+    columns = [column.key for column in model.__table__.columns if column.key != "id"]
+    copied = 0
+
+    async for rows in _iter_slot_rows(model, source, shard_map, start, end, batch_size):
+        async with target() as target_session:
+            existing = {
+                getattr(row, identity_column.key): row
+                for row in (await target_session.execute(
+                    select(model).where(identity_column.in_([getattr(row, identity_column.key) for row in rows]))
+                )).scalars().all()
+            }
+            for row in rows:
+                current = existing.get(getattr(row, identity_column.key))
+                if current is None:
+                    target_session.add(model(**{column: getattr(row, column) for column in columns}))
+                elif "updated_at" in columns and row.updated_at > current.updated_at:
+                    # Carry over a change made on the old owner, but never undo
+                    # one made on the target after the flip
+                    for column in columns:
+                        setattr(current, column, getattr(row, column))
+                else:
+                    continue
+                copied += 1
+            await target_session.commit()
+
+    return copied
+
+
+async def _delete_rows(
+        model,
+        source: sessionmaker,
+        shard_map: ShardMap,
+        start: int,
+        end: int,
+        batch_size: int
+) -> int:
+    _, _, identity_column = SHARDED_MODELS[model]
+    deleted = 0
+
+    async for rows in _iter_slot_rows(model, source, shard_map, start, end, batch_size):
+        async with source() as source_session:
+            await source_session.execute(
+                delete(model).where(identity_column.in_([getattr(row, identity_column.key) for row in rows]))
+            )
+            await source_session.commit()
+        deleted += len(rows)
+
+    return deleted
+
+
+def _range_sources(shard_map: ShardMap, start: int, end: int, target: str) -> Set[str]:
+    return {shard_map.slots[slot] for slot in range(start, end)} - {target}
+
+
+async def copy_slot_range(
+        shard_sessions: Dict[str, sessionmaker],
+        shard_map: ShardMap,
+        start: int,
+        end: int,
+        target: str,
+        sources: Set[str],
+        batch_size: int = settings.ARCHIVE_BATCH_SIZE
+) -> Dict[str, int]:
+    """Upserts every row of the slot range from ``sources`` onto ``target``."""
+    stats = {model.__tablename__: 0 for model in SHARDED_MODELS}
+    for source in sources:
+        for model in SHARDED_MODELS:
+            stats[model.__tablename__] += await _copy_rows(
+                model, shard_sessions[source], shard_sessions[target], shard_map, start, end, batch_size
+            )
+    return stats
+
+
+async def delete_slot_range(
+        shard_sessions: Dict[str, sessionmaker],
+        shard_map: ShardMap,
+        start: int,
+        end: int,
+        sources: Set[str],
+        batch_size: int = settings.ARCHIVE_BATCH_SIZE
+) -> Dict[str, int]:
+    """Deletes the slot range's rows from shards that no longer own it."""
+    stats = {model.__tablename__: 0 for model in SHARDED_MODELS}
+    for source in sources:
+        for model in SHARDED_MODELS:
+            stats[model.__tablename__] += await _delete_rows(
+                model, shard_sessions[source], shard_map, start, end, batch_size
+            )
+    return stats
+
+
+async def move_slot_range(
+        shard_sessions: Dict[str, sessionmaker],
+        shard_map: ShardMap,
+        start: int,
+        end: int,
+        target: str,
+        batch_size: int = settings.ARCHIVE_BATCH_SIZE,
+        map_path: Optional[str] = None,
+        wait_for_workers: Optional[Callable[[int], Awaitable[None]]] = None
+) -> Dict[str, int]:
+    """Moves slots ``start`` (inclusive) to ``end`` (exclusive) onto ``target``.
+
+    Rows are copied while the old owners still serve the range, then the map
+    is flipped and saved. ``wait_for_workers`` is awaited with the new map
+    version and must return once no worker routes with an older map; a
+    second copy then picks up rows written to the old owners in the meantime,
+    and only then are the rows deleted from them. Returns the rows moved per
+    table.
+    """
+    if target not in shard_sessions:
+        raise ValueError(f"Unknown shard: {target}")
+
+    sources = _range_sources(shard_map, start, end, target)
+    await copy_slot_range(shard_sessions, shard_map, start, end, target, sources, batch_size)
+
+    shard_map.assign(start, end, target)
+    if map_path:
+        shard_map.save(map_path)
+    if wait_for_workers:
+        await wait_for_workers(shard_map.version)
+
+    await copy_slot_range(shard_sessions, shard_map, start, end, target, sources, batch_size)
+    stats = await delete_slot_range(shard_sessions, shard_map, start, end, sources, batch_size)
+
+    logger.info("Moved slots %s-%s to %s: %s", start, end, target, stats)
+    return stats
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Move a hash slot range to another shard")
+    parser.add_argument("--start", type=int, required=True)
+    parser.add_argument("--end", type=int, required=True)
+    parser.add_argument("--target", required=True)
+    parser.add_argument("--batch-size", type=int, default=settings.ARCHIVE_BATCH_SIZE)
+    parser.add_argument(
+        "--ack-timeout",
+        type=float,
+        default=settings.SHARD_MAP_ACK_TIMEOUT,
+        help="seconds to wait for workers to load the new map before giving up"
+    )
+    args = parser.parse_args()
+
+    if not settings.SHARD_MAP_PATH:
+        parser.error("SHARD_MAP_PATH must be set so the new shard map is persisted")
+
+    redis_client = redis.from_url(settings.REDIS_URL)
+    stats = asyncio.run(move_slot_range(
+        create_shard_sessions(settings.SHARD_DATABASE_URLS),
+        get_shard_map(),
+        args.start,
+        args.end,
+        args.target,
+        args.batch_size,
+        settings.SHARD_MAP_PATH,
+        lambda version: wait_for_shard_map_acknowledgements(redis_client, version, args.ack_timeout)
+    ))
+    print(stats)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+from typing import Dict, List, Optional
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import socket
+import time
+from redis.asyncio import Redis
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Redis key per worker holding the shard map version it routes with
+SHARD_MAP_ACK_PREFIX = "shard_map:ack:"
+
+
+class ShardMap:
+    """Maps routing keys to shards through a fixed set of hash slots.
+
+    Keys hash into one of ``slot_count`` slots and each slot is owned by one
+    shard, so rebalancing moves slot ranges instead of rehashing every key.
+    Every reassignment bumps ``version`` so workers can report which map
+    they route with.
+    """
+
+    def __init__(self, slots: List[str], version: int = 0):
+        if not slots:
+            raise ValueError("Shard map needs at least one slot")
+        self.slots = slots
+        self.version = version
+
+    @property
+    def slot_count(self) -> int:
+        return len(self.slots)
+
+    @property
+    def shards(self) -> List[str]:
+        return sorted(set(self.slots))
+
+    @classmethod
+    def even(cls, shards: List[str], slot_count: int = settings.SHARD_SLOT_COUNT) -> "ShardMap":
+        shards = sorted(shards)
+        return cls([shards[slot * len(shards) // slot_count] for slot in range(slot_count)])
+
+    def slot_for_key(self, key: str) -> int:
+        digest = hashlib.md5(key.encode()).hexdigest()
+        return int(digest[:8], 16) % self.slot_count
+
+    def shard_for_key(self, key: str) -> str:
+        return self.slots[self.slot_for_key(key)]
+
+    def assign(self, start: int, end: int, shard: str) -> None:
+        """Assigns slots ``start`` (inclusive) to ``end`` (exclusive) to ``shard``."""
+        if not 0 <= start < end <= self.slot_count:
+            raise ValueError(f"Invalid slot range {start}-{end}")
+        self.slots[start:end] = [shard] * (end - start)
+        self.version += 1
+
+    def to_dict(self) -> Dict[str, list]:
+        ranges = []
+        start = 0
+        for slot in range(1, self.slot_count + 1):
+            if slot == self.slot_count or self.slots[slot] != self.slots[start]:
+                ranges.append([start, slot, self.slots[start]])
+                start = slot
+        return {"version": self.version, "slot_count": self.slot_count, "ranges": ranges}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, list]) -> "ShardMap":
+        slots: List[Optional[str]] = [None] * data["slot_count"]
+        for start, end, shard in data["ranges"]:
+            slots[start:end] = [shard] * (end - start)
+        if None in slots:
+            raise ValueError("Shard map does not cover every slot")
+        return cls(slots, data.get("version", 0))
+
+    @classmethod
+    def load(cls, path: str) -> "ShardMap":
+        with open(path) as f:
+            return cls.from_dict(json.load(f))
+
+    def save(self, path: str) -> None:
+        # Written aside and renamed so a reloading worker never reads half a map
+        temporary_path = f"{path}.tmp"
+        with open(temporary_path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+        os.replace(temporary_path, path)
+
+
+class ShardMapWatcher:
+    """Keeps a worker's shard map in step with ``SHARD_MAP_PATH``.
+
+    The map is reloaded whenever the file changes, and the version in use is
+    acknowledged in Redis under a key that expires unless refreshed, so the
+    rebalancer can wait for every live worker before deleting moved rows.
+    """
+
+    def __init__(
+            self,
+            shard_map: ShardMap,
+            path: Optional[str],
+            redis_client: Redis,
+            worker_id: Optional[str] = None
+    ):
+        self.shard_map = shard_map
+        self.path = path
+        self.redis = redis_client
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self._mtime: Optional[int] = None
+
+    def reload(self) -> bool:
+        """Loads the map file if it changed since the last call; returns whether it did."""
+        if not self.path or not os.path.exists(self.path):
+            return False
+        mtime = os.stat(self.path).st_mtime_ns
+        if mtime == self._mtime:
+            return False
+
+        shard_map = ShardMap.load(self.path)
+        self._mtime = mtime
+        # Never step back, e.g. when an older copy is restored over the file
+        if shard_map.version <= self.shard_map.version:
+            return False
+        self.shard_map = shard_map
+        return True
+
+    async def acknowledge(self) -> None:
+        await self.redis.set(
+            f"{SHARD_MAP_ACK_PREFIX}{self.worker_id}",
+            self.shard_map.version,
+            ex=settings.SHARD_MAP_ACK_TTL
+        )
+
+    async def run_forever(self, interval: float = settings.SHARD_MAP_RELOAD_INTERVAL) -> None:
+        while True:
+            try:
+                if self.reload():
+                    logger.info("Loaded shard map version %s", self.shard_map.version)
+                await self.acknowledge()
+            except Exception:
+                logger.exception("Shard map reload failed")
+            await asyncio.sleep(interval)
+
+
+async def wait_for_shard_map_acknowledgements(
+        redis_client: Redis,
+        version: int,
+        timeout: float = settings.SHARD_MAP_ACK_TIMEOUT,
+        poll_interval: float = settings.SHARD_MAP_RELOAD_INTERVAL
+) -> None:
+    """Waits until no live worker acknowledges a map older than ``version``."""
+    deadline = time.monotonic() + timeout
+    while True:
+        stale = []
+        async for key in redis_client.scan_iter(match=f"{SHARD_MAP_ACK_PREFIX}*"):
+            acknowledged = await redis_client.get(key)
+            # A missing value means the worker's key expired between scan and get
+            if acknowledged is not None and int(acknowledged) < version:
+                stale.append(key.decode() if isinstance(key, bytes) else key)
+        if not stale:
+            return
+        if time.monotonic() >= deadline:
+            raise TimeoutError(f"Workers still route with shard maps older than {version}: {sorted(stale)}")
+        await asyncio.sleep(poll_interval)
+
+
+def get_shard_map() -> ShardMap:
+    if settings.SHARD_MAP_PATH and os.path.exists(settings.SHARD_MAP_PATH):
+        return ShardMap.load(settings.SHARD_MAP_PATH)
+    return ShardMap.even(list(settings.SHARD_DATABASE_URLS))
+
+
+def create_shard_sessions(database_urls: Dict[str, str]) -> Dict[str, sessionmaker]:
+    """Creates one async engine and session factory per shard."""
+    return {
+        name: sessionmaker(
+            create_async_engine(url, echo=settings.DB_ECHO, future=True),
+            class_=AsyncSession,
+            expire_on_commit=False,
+            autocommit=False,
+            autoflush=False,
+        )
+        for name, url in database_urls.items()
+    }
@@ -1,11 +1,45 @@
+from contextlib import asynccontextmanager
+import asyncio
+import logging
 from fastapi import FastAPI
 from app.core.config import settings
-from app.routers.ticket_router import router as ticket_router
+from app.db.sessions import AsyncSessionLocal
+from app.routers.ticket_router import router as ticket_router, shard_map_watcher, shard_sessions
+from app.services.retention_service import RetentionService
+
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    background_tasks = []
+    if shard_map_watcher:
+        # Reloads the shard map and acknowledges its version to the rebalancer
+        background_tasks.append(asyncio.create_task(shard_map_watcher.run_forever()))
+
+    if settings.RETENTION_ENABLED:
+        # Each shard is its own database with its own tables to maintain
+        for session_factory in list(shard_sessions.values()) or [AsyncSessionLocal]:
+            retention_service = RetentionService(session_factory)
+            # Booking inserts fail until today's partition exists; if this
+            # fails the retention loop creates it on its next run
+            try:
+                await retention_service.prepare_partitions()
+            except Exception:
+                logger.exception("Preparing booking response partitions failed")
+            background_tasks.append(asyncio.create_task(retention_service.run_forever()))
+
+    yield
+
+    for background_task in background_tasks:
+        background_task.cancel()
+
 
 app = FastAPI(
     title=settings.APP_NAME,
     version=settings.APP_VERSION,
-    debug=settings.DEBUG
+    debug=settings.DEBUG,
+    lifespan=lifespan
 )
 
 app.include_router(ticket_router, prefix=settings.API_V1_PREFIX)
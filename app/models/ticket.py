@@ -1,5 +1,4 @@
 from datetime import datetime
-import json
 from sqlalchemy import (
     Column,
     Integer,
@@ -7,9 +6,12 @@ from sqlalchemy import (
     DateTime,
     Enum as SQLEnum,
     Float,
-    Text,
-    TypeDecorator
+    Index,
+    JSON,
+    func,
+    text
 )
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.ext.declarative import declarative_base
 from enum import Enum
 
@@ -21,38 +23,75 @@ class TicketStatus(str, Enum):
     CANCELLED = "CANCELLED"
 
 
-class JSONEncodedDict(TypeDecorator):
-    """Represents an immutable structure as a json-encoded string."""
-    impl = Text
-
-    def process_bind_param(self, value, dialect):
-        if value is not None:
-            value = json.dumps(value)
-        return value
-
-    def process_result_value(self, value, dialect):
-        if value is not None:
-            value = json.loads(value)
-        return value
+# Stored as JSONB on Postgres, plain JSON elsewhere
+JSONDocument = JSON().with_variant(JSONB(), "postgresql")
 
 
 class BookingResponse(Base):
+    """Stored booking responses, range-partitioned by day on Postgres.
+
+    Partitioned tables require the partition key in every unique constraint,
+    so the primary key is (request_id, created_at) and BookingRequestKey
+    keeps request_id itself unique.
+    """
     __tablename__ = "booking_responses"
+    __table_args__ = {"postgresql_partition_by": "RANGE (created_at)"}
 
-    id = Column(Integer, primary_key=True)
-    request_id = Column(String(50), unique=True, nullable=False)
-    response_data = Column(JSONEncodedDict, nullable=False)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    request_id = Column(String(50), primary_key=True)
+    response_data = Column(JSONDocument, nullable=False)
+    created_at = Column(DateTime, primary_key=True, default=datetime.utcnow)
+
+
+class BookingRequestKey(Base):
+    """Unpartitioned request_id registry, written with every BookingResponse."""
+    __tablename__ = "booking_request_keys"
+
+    request_id = Column(String(50), primary_key=True)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
 
 
 class Ticket(Base):
     __tablename__ = "tickets"
+    __table_args__ = (
+        # At most one BOOKED ticket per seat, even when bookings race
+        Index(
+            "uq_tickets_booked_seat",
+            "seat_number",
+            unique=True,
+            postgresql_where=text("status = 'BOOKED'"),
+            sqlite_where=text("status = 'BOOKED'")
+        ),
+        # Lets the archiver walk old cancellations in id order without
+        # scanning every booked ticket
+        Index(
+            "ix_tickets_cancelled_id",
+            "id",
+            "updated_at",
+            postgresql_where=text("status = 'CANCELLED'"),
+            sqlite_where=text("status = 'CANCELLED'")
+        ),
+    )
 
     id = Column(Integer, primary_key=True)
     booking_reference = Column(String(50), unique=True, nullable=False)
-    customer_name = Column(String(100), nullable=False)
+    passenger_name = Column(String(100), nullable=False)
     seat_number = Column(String(10), nullable=False)
     amount = Column(Float, nullable=False)
     status = Column(SQLEnum(TicketStatus), nullable=False, default=TicketStatus.BOOKED)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class TicketArchive(Base):
+    __tablename__ = "tickets_archive"
+
+    # Keeps the id the ticket had in the hot table
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    booking_reference = Column(String(50), nullable=False, index=True)
+    passenger_name = Column(String(100), nullable=False)
+    seat_number = Column(String(10), nullable=False)
+    amount = Column(Float, nullable=False)
+    status = Column(SQLEnum(TicketStatus), nullable=False)
+    created_at = Column(DateTime)
+    updated_at = Column(DateTime)
+    archived_at = Column(DateTime, nullable=False, server_default=func.now())
@@ -0,0 +1,180 @@
+from contextlib import asynccontextmanager
+from datetime import date, datetime, timedelta
+from typing import AsyncIterator, List, Optional, Tuple
+from sqlalchemy import delete, insert, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from app.models.ticket import Ticket, TicketArchive, BookingRequestKey, BookingResponse, TicketStatus
+
+PARTITION_PREFIX = f"{BookingResponse.__tablename__}_"
+
+# Advisory lock serializing retention work across the workers sharing a database
+RETENTION_LOCK_NAME = "ticket-service:retention"
+
+ARCHIVED_TICKET_COLUMNS = [
+    "id",
+    "booking_reference",
+    "passenger_name",
+    "seat_number",
+    "amount",
+    "status",
+    "created_at",
+    "updated_at",
+]
+
+
+class RetentionRepository:
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    @property
+    def supports_partitions(self) -> bool:
+        return self.session.bind.dialect.name == "postgresql"
+
+    @asynccontextmanager
+    async def retention_lock(self, wait: bool = False) -> AsyncIterator[bool]:
+        """Holds the retention advisory lock, yielding whether it was acquired.
+
+        The lock lives on its own autocommit connection so it is released if
+        the worker dies. Only Postgres is coordinated; other databases are
+        single-process development setups.
+        """
+        if self.session.bind.dialect.name != "postgresql":
+            yield True
+            return
+
+        async with self.session.bind.connect() as connection:
+            connection = await connection.execution_options(isolation_level="AUTOCOMMIT")
+            if wait:
+                await connection.execute(
+                    text("SELECT pg_advisory_lock(hashtext(:name))"),
+                    {"name": RETENTION_LOCK_NAME}
+                )
+                acquired = True
+            else:
+                acquired = await connection.scalar(
+                    text("SELECT pg_try_advisory_lock(hashtext(:name))"),
+                    {"name": RETENTION_LOCK_NAME}
+                )
+            try:
+                yield acquired
+            finally:
+                if acquired:
+                    await connection.execute(
+                        text("SELECT pg_advisory_unlock(hashtext(:name))"),
+                        {"name": RETENTION_LOCK_NAME}
+                    )
+
+    async def ensure_booking_response_partitions(self, start: date, days: int) -> None:
+        for offset in range(days):
+            day = start + timedelta(days=offset)
+            await self.session.execute(text(
+                f"CREATE TABLE IF NOT EXISTS {PARTITION_PREFIX}{day:%Y%m%d} "
+                f"PARTITION OF {BookingResponse.__tablename__} "
+                f"FOR VALUES FROM ('{day.isoformat()}') TO ('{(day + timedelta(days=1)).isoformat()}')"
+            ))
+        await self.session.commit()
+
+    async def _get_partition_tables(self, connection) -> List[Tuple[str, bool, bool]]:
+        # Also lists tables a previous run detached but did not get to drop
+        result = await connection.execute(
+            text(
+                "SELECT child.relname, pg_inherits.inhrelid IS NOT NULL, "
+                "COALESCE(pg_inherits.inhdetachpending, false) "
+                "FROM pg_class child "
+                "LEFT JOIN pg_inherits ON pg_inherits.inhrelid = child.oid "
+                "WHERE child.relkind = 'r' AND child.relname LIKE :pattern"
+            ),
+            {"pattern": PARTITION_PREFIX.replace("_", "\\_") + "%"}
+        )
+        return [tuple(row) for row in result]
+
+    async def drop_booking_response_partitions_before(self, cutoff: datetime) -> int:
+        """Drops day partitions wholly before ``cutoff``, returning the rows dropped."""
+        dropped = 0
+        # DETACH ... CONCURRENTLY only takes a SHARE UPDATE EXCLUSIVE lock on the
+        # parent, but cannot run inside a transaction block
+        async with self.session.bind.connect() as connection:
+            connection = await connection.execution_options(isolation_level="AUTOCOMMIT")
+            for partition, attached, detach_pending in await self._get_partition_tables(connection):
+                try:
+                    day = datetime.strptime(partition[len(PARTITION_PREFIX):], "%Y%m%d")
+                except ValueError:
+                    continue
+                # Only drop partitions whose whole range is past the cutoff
+                if day + timedelta(days=1) > cutoff:
+                    continue
+
+                parent = BookingResponse.__tablename__
+                if detach_pending:
+                    # An interrupted concurrent detach has to be finalized first
+                    await connection.execute(text(f"ALTER TABLE {parent} DETACH PARTITION {partition} FINALIZE"))
+                elif attached:
+                    await connection.execute(text(f"ALTER TABLE {parent} DETACH PARTITION {partition} CONCURRENTLY"))
+                # Detached, so counting and dropping only touch the old partition
+                dropped += await connection.scalar(text(f"SELECT count(*) FROM {partition}"))
+                await connection.execute(text(f"DROP TABLE {partition}"))
+        return dropped
+
+    async def delete_booking_responses_before(self, cutoff: datetime, limit: int) -> int:
+        expired = (
+            select(BookingResponse.request_id)
+            .where(BookingResponse.created_at < cutoff)
+            .limit(limit)
+        )
+        result = await self.session.execute(
+            delete(BookingResponse)
+            .where(BookingResponse.request_id.in_(expired))
+            .where(BookingResponse.created_at < cutoff)
+        )
+        await self.session.commit()
+        return result.rowcount
+
+    async def delete_booking_request_keys_before(self, cutoff: datetime, limit: int) -> int:
+        expired = (
+            select(BookingRequestKey.request_id)
+            .where(BookingRequestKey.created_at < cutoff)
+            .limit(limit)
+        )
+        result = await self.session.execute(
+            delete(BookingRequestKey).where(BookingRequestKey.request_id.in_(expired))
+        )
+        await self.session.commit()
+        return result.rowcount
+
+    async def archive_cancelled_tickets_before(
+            self,
+            cutoff: datetime,
+            limit: int,
+            after: Optional[int] = None
+    ) -> List[int]:
+        """Archives up to ``limit`` cancellations with ids above ``after``.
+
+        Returns the archived ids so the caller can resume after the last one.
+        """
+        query = (
+            select(Ticket.id)
+            .where(Ticket.status == TicketStatus.CANCELLED)
+            .where(Ticket.updated_at < cutoff)
+            .order_by(Ticket.id)
+            .limit(limit)
+            # SKIP LOCKED keeps the archiver from waiting on rows a booking is touching
+            .with_for_update(skip_locked=True)
+        )
+        if after is not None:
+            query = query.where(Ticket.id > after)
+        ticket_ids = (await self.session.execute(query)).scalars().all()
+        if not ticket_ids:
+            await self.session.commit()
+            return []
+
+        await self.session.execute(
+            insert(TicketArchive).from_select(
+                ARCHIVED_TICKET_COLUMNS,
+                select(*[getattr(Ticket, column) for column in ARCHIVED_TICKET_COLUMNS])
+                .where(Ticket.id.in_(ticket_ids))
+            )
+        )
+        await self.session.execute(delete(Ticket).where(Ticket.id.in_(ticket_ids)))
+        await self.session.commit()
+        return ticket_ids
@@ -1,8 +1,22 @@
-from typing import Optional, List, Tuple
-from sqlalchemy import select, func
+from contextlib import aclosing
+from datetime import datetime
+from typing import AsyncIterator, Dict, Optional, List, Tuple
+import asyncio
+import heapq
+from sqlalchemy import select, func, tuple_
+from sqlalchemy.exc import MultipleResultsFound
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from app.models.ticket import Ticket, BookingResponse, TicketStatus
+from sqlalchemy.orm import sessionmaker
+from app.db.sharding import ShardMap
+from app.models.ticket import Ticket, BookingRequestKey, BookingResponse, TicketStatus
+
+# Global ordering used when merging results from several shards
+TICKET_MERGE_ORDER = (Ticket.created_at, Ticket.booking_reference)
+
+
+def _ticket_merge_key(ticket: Ticket) -> tuple:
+    return ticket.created_at, ticket.booking_reference
 
 
 class TicketRepository:
@@ -27,6 +41,12 @@ class TicketRepository:
         )
         return result.scalar_one_or_none()
 
+    async def get_booked_ticket_by_seat(self, seat_number: str) -> Optional[Ticket]:
+        result = await self.session.execute(
+            select(Ticket).filter_by(seat_number=seat_number, status=TicketStatus.BOOKED)
+        )
+        return result.scalar_one_or_none()
+
     async def get_tickets_paginated(self, page: int, size: int) -> Tuple[List[Ticket], int]:
         offset = (page - 1) * size
 
@@ -49,16 +69,180 @@ class TicketRepository:
         return ticket
 
     async def save_booking_response(self, request_id: str, response: dict) -> BookingResponse:
+        created_at = datetime.utcnow()
         booking_response = BookingResponse(
             request_id=request_id,
-            response_data=response
+            response_data=response,
+            created_at=created_at
         )
+        # The key row fails the commit if request_id already has a response
+        self.session.add(BookingRequestKey(request_id=request_id, created_at=created_at))
         self.session.add(booking_response)
         await self.session.commit()
         return booking_response
 
     async def get_booking_response(self, request_id: str) -> Optional[BookingResponse]:
+        # Keys can expire before their partition is dropped, so a request_id may repeat
         result = await self.session.execute(
-            select(BookingResponse).filter_by(request_id=request_id)
+            select(BookingResponse)
+            .filter_by(request_id=request_id)
+            .order_by(BookingResponse.created_at)
+            .limit(1)
         )
-        return result.scalar_one_or_none()
+        return result.scalars().first()
+
+    async def get_tickets_ordered(self, limit: int, after: Optional[tuple] = None) -> List[Ticket]:
+        query = select(Ticket).order_by(*TICKET_MERGE_ORDER).limit(limit)
+        if after is not None:
+            query = query.where(tuple_(*TICKET_MERGE_ORDER) > after)
+        result = await self.session.execute(query)
+        return result.scalars().all()
+
+    async def rollback(self) -> None:
+        await self.session.rollback()
+
+
+class ShardedTicketRepository:
+    """TicketRepository spread across several databases.
+
+    Tickets are routed by ``seat_number`` so every booking of a seat meets the
+    same ``uq_tickets_booked_seat`` index, and stored responses by
+    ``request_id``. Lookups by ``booking_reference`` and listing scatter to
+    every shard. Ticket ids are only unique within a shard and change when a
+    rebalance moves the ticket, so ``booking_reference`` is the stable
+    identifier.
+    """
+
+    def __init__(self, shard_sessions: Dict[str, sessionmaker], shard_map: ShardMap):
+        self.shard_sessions = shard_sessions
+        self.shard_map = shard_map
+
+    async def _on_shard(self, shard: str, operation):
+        async with self.shard_sessions[shard]() as session:
+            return await operation(TicketRepository(session))
+
+    async def _on_key(self, key: str, operation):
+        return await self._on_shard(self.shard_map.shard_for_key(key), operation)
+
+    async def _on_all_shards(self, operation) -> Dict[str, object]:
+        shards = list(self.shard_sessions)
+        results = await asyncio.gather(*[self._on_shard(shard, operation) for shard in shards])
+        return dict(zip(shards, results))
+
+    def _owns(self, shard: str, ticket: Ticket) -> bool:
+        # A rebalance briefly leaves a copy on both shards; the map decides which is live
+        return self.shard_map.shard_for_key(ticket.seat_number) == shard
+
+    async def _find_ticket(self, booking_reference: str) -> Tuple[Optional[str], Optional[Ticket]]:
+        tickets = await self._on_all_shards(
+            lambda repository: repository.get_ticket(booking_reference)
+        )
+        return next(
+            ((shard, ticket) for shard, ticket in tickets.items() if ticket and self._owns(shard, ticket)),
+            (None, None)
+        )
+
+    async def create_ticket(self, ticket_data: dict) -> Ticket:
+        return await self._on_key(
+            ticket_data["seat_number"],
+            lambda repository: repository.create_ticket(ticket_data)
+        )
+
+    async def get_ticket(self, booking_reference: str) -> Optional[Ticket]:
+        _, ticket = await self._find_ticket(booking_reference)
+        return ticket
+
+    async def get_ticket_by_id(self, ticket_id: int) -> Optional[Ticket]:
+        tickets = await self._on_all_shards(
+            lambda repository: repository.get_ticket_by_id(ticket_id)
+        )
+        matches = [ticket for ticket in tickets.values() if ticket]
+        if len(matches) > 1:
+            raise MultipleResultsFound(f"Ticket id {ticket_id} exists on {len(matches)} shards")
+        return matches[0] if matches else None
+
+    async def get_booked_ticket_by_seat(self, seat_number: str) -> Optional[Ticket]:
+        return await self._on_key(
+            seat_number,
+            lambda repository: repository.get_booked_ticket_by_seat(seat_number)
+        )
+
+    async def get_tickets_paginated(
+            self,
+            page: int,
+            size: int,
+            after: Optional[tuple] = None
+    ) -> Tuple[List[Ticket], int]:
+        """Returns a page in global merge order.
+
+        Pass the merge key of the previous page's last ticket as ``after`` to
+        seek straight to the next page; without it earlier pages are streamed
+        past, holding at most ``size`` rows per shard in memory.
+        """
+        skip = 0 if after is not None else (page - 1) * size
+        totals = await self._on_all_shards(
+            lambda repository: repository.session.scalar(select(func.count()).select_from(Ticket))
+        )
+
+        tickets = []
+        async with aclosing(self.export_tickets(batch_size=size, after=after)) as stream:
+            async for ticket in stream:
+                if skip:
+                    skip -= 1
+                    continue
+                tickets.append(ticket)
+                if len(tickets) == size:
+                    break
+
+        return tickets, sum(totals.values())
+
+    async def export_tickets(self, batch_size: int = 500, after: Optional[tuple] = None) -> AsyncIterator[Ticket]:
+        """Streams every ticket from all shards in global merge order."""
+        buffers: Dict[str, List[Ticket]] = {}
+        heap = []
+
+        async def refill(shard: str, after: Optional[tuple]) -> None:
+            buffers[shard] = list(reversed(await self._on_shard(
+                shard,
+                lambda repository: repository.get_tickets_ordered(batch_size, after)
+            )))
+            if buffers[shard]:
+                heapq.heappush(heap, (_ticket_merge_key(buffers[shard][-1]), shard))
+
+        for shard in self.shard_sessions:
+            await refill(shard, after)
+
+        while heap:
+            key, shard = heapq.heappop(heap)
+            ticket = buffers[shard].pop()
+            if self._owns(shard, ticket):
+                yield ticket
+            if buffers[shard]:
+                heapq.heappush(heap, (_ticket_merge_key(buffers[shard][-1]), shard))
+            else:
+                await refill(shard, key)
+
+    async def update_ticket_status(self, booking_reference: str, status: TicketStatus) -> Optional[Ticket]:
+        shard, _ = await self._find_ticket(booking_reference)
+        if not shard:
+            return None
+        return await self._on_shard(
+            shard,
+            lambda repository: repository.update_ticket_status(booking_reference, status)
+        )
+
+    async def save_booking_response(self, request_id: str, response: dict) -> BookingResponse:
+        return await self._on_key(
+            request_id,
+            lambda repository: repository.save_booking_response(request_id, response)
+        )
+
+    async def get_booking_response(self, request_id: str) -> Optional[BookingResponse]:
+        return await self._on_key(
+            request_id,
+            lambda repository: repository.get_booking_response(request_id)
+        )
+
+    async def rollback(self) -> None:
+        # Every operation commits in its own shard session
+        pass
@@ -1,10 +1,12 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
 from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Optional
-from app.db.session import get_db
+from app.db.sessions import get_db
 from app.services.ticket_service import TicketService
-from app.repositories.ticket_repository import TicketRepository
-from app.redis_cache import RedisCache
+from app.services.single_flight import SingleFlight
+from app.repositories.ticket_repository import TicketRepository, ShardedTicketRepository
+from app.db.sharding import ShardMapWatcher, create_shard_sessions, get_shard_map
+from app.cache.redis_cache import RedisCache
 from app.schemas import (
     TicketCreate,
     TicketResponse,
@@ -12,7 +14,7 @@ from app.schemas import (
     PaginatedResponse,
     BookingResponse
 )
-import redis
+import redis.asyncio as redis
 from app.core.config import settings
 
 router = APIRouter()
@@ -21,28 +23,44 @@ router = APIRouter()
 redis_client = redis.from_url(settings.REDIS_URL)
 redis_cache = RedisCache(redis_client)
 
+# Shared across requests so concurrent duplicates in this worker coalesce
+booking_single_flight = SingleFlight(wait_timeout=settings.COALESCE_WAIT_TIMEOUT)
+
+
+# Shard engines, only when SHARD_DATABASE_URLS is configured; the lifespan
+# runs the watcher that reloads the map after a rebalance
+shard_sessions = create_shard_sessions(settings.SHARD_DATABASE_URLS)
+shard_map_watcher = (
+    ShardMapWatcher(get_shard_map(), settings.SHARD_MAP_PATH, redis_client)
+    if shard_sessions else None
+)
+
 
 # Dependency for TicketService
 async def get_ticket_service(db: AsyncSession = Depends(get_db)) -> TicketService:
-    repository = TicketRepository(db)
-    return TicketService(repository, redis_cache)
+    if shard_sessions:
+        repository = ShardedTicketRepository(shard_sessions, shard_map_watcher.shard_map)
+    else:
+        repository = TicketRepository(db)
+    return TicketService(repository, redis_cache, booking_single_flight)
 
 
 @router.post("/tickets", response_model=BookingResponse)
 async def book_ticket(
         ticket: TicketCreate,
+        request_id: str = Header(..., alias="X-Request-ID"),
         service: TicketService = Depends(get_ticket_service)
 ):
-    response, status_code = await service.book_ticket(ticket)
-    return response
+    return await service.book_ticket(request_id, ticket.model_dump())
 
 
-@router.get("/tickets/{ticket_id}", response_model=TicketResponse)
+# Tickets are addressed by booking_reference: ids are only unique within a shard
+@router.get("/tickets/{booking_reference}", response_model=TicketResponse)
 async def get_ticket_details(
-        ticket_id: int,
+        booking_reference: str,
         service: TicketService = Depends(get_ticket_service)
 ):
-    ticket = await service.get_ticket_details(ticket_id)
+    ticket = await service.get_ticket_details(booking_reference)
     if not ticket:
         raise HTTPException(status_code=404, detail="Ticket not found")
     return ticket
@@ -58,10 +76,14 @@ async def list_tickets(
     return await service.get_list_of_tickets(pagination)
 
 
-@router.delete("/tickets/{ticket_id}", response_model=BookingResponse)
+@router.delete("/tickets/{booking_reference}", response_model=BookingResponse)
 async def cancel_ticket(
-        ticket_id: int,
+        booking_reference: str,
         service: TicketService = Depends(get_ticket_service)
 ):
-    response, status_code = await service.cancel_ticket(ticket_id)
-    return response
+    return await service.cancel_ticket(booking_reference)
+
+
+@router.get("/metrics")
+async def booking_metrics():
+    return {"coalesced_requests": booking_single_flight.coalesced_count}
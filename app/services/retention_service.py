@@ -0,0 +1,127 @@
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Optional
+import asyncio
+import logging
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
+from app.repositories.retention_repository import RetentionRepository
+
+logger = logging.getLogger(__name__)
+
+
+class RetentionService:
+    """Expires stored booking responses and archives old cancelled tickets.
+
+    Every batch runs in its own short transaction so the archiver never holds
+    locks on the hot tables for longer than one chunk. Every worker runs the
+    loop, but an advisory lock lets only one of them work on a database at a
+    time.
+    """
+
+    def __init__(
+            self,
+            session_factory: Callable[[], AsyncSession],
+            batch_size: int = settings.ARCHIVE_BATCH_SIZE,
+            batch_pause: float = settings.ARCHIVE_BATCH_PAUSE
+    ):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.batch_pause = batch_pause
+
+    def _booking_response_cutoff(self, now: datetime) -> datetime:
+        retention = max(settings.BOOKING_RESPONSE_RETENTION, settings.CACHE_TTL)
+        return now - timedelta(seconds=retention)
+
+    def _cancelled_ticket_cutoff(self, now: datetime) -> datetime:
+        return now - timedelta(seconds=settings.CANCELLED_TICKET_RETENTION)
+
+    async def prepare_partitions(self, now: Optional[datetime] = None) -> None:
+        # Waits for the lock: bookings fail until today's partition exists
+        async with self.session_factory() as session:
+            async with RetentionRepository(session).retention_lock(wait=True):
+                await self._prepare_partitions(now)
+
+    async def _prepare_partitions(self, now: Optional[datetime] = None) -> None:
+        now = now or datetime.utcnow()
+        async with self.session_factory() as session:
+            repository = RetentionRepository(session)
+            if repository.supports_partitions:
+                await repository.ensure_booking_response_partitions(
+                    now.date(),
+                    settings.BOOKING_RESPONSE_PARTITIONS_AHEAD
+                )
+
+    async def purge_booking_responses(self, now: Optional[datetime] = None) -> int:
+        """Removes expired booking responses and returns how many rows went."""
+        cutoff = self._booking_response_cutoff(now or datetime.utcnow())
+
+        async with self.session_factory() as session:
+            repository = RetentionRepository(session)
+            if repository.supports_partitions:
+                purged = await repository.drop_booking_response_partitions_before(cutoff)
+            else:
+                purged = None
+
+        if purged is None:
+            purged = await self._run_in_batches(
+                lambda repository: repository.delete_booking_responses_before(cutoff, self.batch_size)
+            )
+
+        # Keys expire with the same cutoff; a day partition straddling it may keep
+        # a few responses past their key, which get_booking_response tolerates
+        await self._run_in_batches(
+            lambda repository: repository.delete_booking_request_keys_before(cutoff, self.batch_size)
+        )
+        return purged
+
+    async def archive_cancelled_tickets(self, now: Optional[datetime] = None) -> int:
+        cutoff = self._cancelled_ticket_cutoff(now or datetime.utcnow())
+        archived = 0
+        after = None
+        # Each batch resumes after the last archived id instead of rescanning
+        while True:
+            async with self.session_factory() as session:
+                ticket_ids = await RetentionRepository(session).archive_cancelled_tickets_before(
+                    cutoff,
+                    self.batch_size,
+                    after
+                )
+            archived += len(ticket_ids)
+            if len(ticket_ids) < self.batch_size:
+                return archived
+            after = ticket_ids[-1]
+            await asyncio.sleep(self.batch_pause)
+
+    async def _run_in_batches(self, batch) -> int:
+        total = 0
+        while True:
+            async with self.session_factory() as session:
+                processed = await batch(RetentionRepository(session))
+            total += processed
+            if processed < self.batch_size:
+                return total
+            await asyncio.sleep(self.batch_pause)
+
+    async def run_once(self, now: Optional[datetime] = None) -> Optional[Dict[str, int]]:
+        """Runs one retention pass, or returns None if another worker is running one."""
+        async with self.session_factory() as session:
+            async with RetentionRepository(session).retention_lock() as acquired:
+                if not acquired:
+                    return None
+                await self._prepare_partitions(now)
+                return {
+                    "booking_responses_purged": await self.purge_booking_responses(now),
+                    "tickets_archived": await self.archive_cancelled_tickets(now)
+                }
+
+    async def run_forever(self, interval: float = settings.RETENTION_INTERVAL) -> None:
+        while True:
+            try:
+                stats = await self.run_once()
+                if stats is None:
+                    logger.debug("Retention run skipped, another worker holds the lock")
+                else:
+                    logger.info("Retention run completed: %s", stats)
+            except Exception:
+                logger.exception("Retention run failed")
+            await asyncio.sleep(interval)
@@ -0,0 +1,58 @@
+from typing import Any, Awaitable, Callable, Dict, Optional
+import asyncio
+
+
+class SingleFlightTimeout(Exception):
+    """Raised when a coalesced caller gives up waiting on the in-flight call."""
+
+
+class _Call:
+    def __init__(self):
+        self.done = asyncio.Event()
+        self.result: Optional[Any] = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """Coalesces concurrent calls sharing a key into a single execution.
+
+    The first caller for a key awaits ``fn``; callers arriving while it is still
+    running wait (up to ``wait_timeout`` seconds) and receive the same result.
+    Calls coalesce within one event loop, so each worker process has its own.
+    """
+
+    def __init__(self, wait_timeout: float = 10.0):
+        self.wait_timeout = wait_timeout
+        self._calls: Dict[str, _Call] = {}
+        self._coalesced = 0
+
+    @property
+    def coalesced_count(self) -> int:
+        return self._coalesced
+
+    def record_coalesced(self) -> None:
+        self._coalesced += 1
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        call = self._calls.get(key)
+        if call is not None:
+            self._coalesced += 1
+            try:
+                await asyncio.wait_for(call.done.wait(), self.wait_timeout)
+            except asyncio.TimeoutError:
+                raise SingleFlightTimeout(f"Timed out waiting for in-flight request {key}")
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        call = _Call()
+        self._calls[key] = call
+        try:
+            call.result = await fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            self._calls.pop(key, None)
+            call.done.set()
@@ -1,11 +1,16 @@
 from typing import Dict, Any, Optional, Tuple
+import asyncio
 import json
+import time
 import uuid
 from dataclasses import dataclass
+from sqlalchemy.exc import IntegrityError
+from app.core.config import settings
 from app.models.ticket import TicketStatus
 from app.repositories.ticket_repository import TicketRepository
 from app.cache.redis_cache import RedisCache
-from app.schemas import PaginationParams, PaginatedResponse
+from app.services.single_flight import SingleFlight, SingleFlightTimeout
+from app.schemas import PaginationParams, PaginatedResponse, TicketResponse
 
 
 @dataclass
@@ -23,9 +28,15 @@ class ErrorResponse:
 
 
 class TicketService:
-    def __init__(self, repository: TicketRepository, cache: RedisCache):
+    def __init__(
+            self,
+            repository: TicketRepository,
+            cache: RedisCache,
+            single_flight: Optional[SingleFlight] = None
+    ):
         self.repository = repository
         self.cache = cache
+        self.single_flight = single_flight
 
     def _create_error_response(self, code: str, message: str) -> Dict[str, str]:
         return ErrorResponse(code=code, message=message).to_dict()
@@ -37,12 +48,8 @@ class TicketService:
                 return False, f"Missing required field: {field}"
         return True, None
 
-    def _check_seat_availability(self, seat_number: str) -> bool:
-        existing_tickets = self.repository.get_all_tickets()
-        return not any(
-            ticket.seat_number == seat_number and ticket.status == TicketStatus.BOOKED
-            for ticket in existing_tickets
-        )
+    async def _check_seat_availability(self, seat_number: str) -> bool:
+        return await self.repository.get_booked_ticket_by_seat(seat_number) is None
 
     def _validate_request_against_cache(self, current_request: dict, cached_request: dict) -> bool:
         def normalize_request(req: dict) -> str:
@@ -50,14 +57,14 @@ class TicketService:
 
         return normalize_request(current_request) == normalize_request(cached_request)
 
-    def _handle_duplicate_request(self, request_id: str, request_data: dict, cached_request: dict) -> Dict[str, Any]:
+    async def _handle_duplicate_request(self, request_id: str, request_data: dict, cached_request: dict) -> Dict[str, Any]:
         if not self._validate_request_against_cache(request_data, cached_request["data"]):
             return self._create_error_response(
                 "INVALID_DUPLICATE_REQUEST",
                 "Request body does not match original request"
             )
 
-        stored_response = self.repository.get_booking_response(request_id)
+        stored_response = await self.repository.get_booking_response(request_id)
         if not stored_response:
             return self._create_error_response(
                 "RESPONSE_NOT_FOUND",
@@ -80,12 +87,12 @@ class TicketService:
             }
         }
 
-    def _process_new_booking(self, request_id: str, request_data: dict) -> Dict[str, Any]:
+    async def _process_new_booking(self, request_id: str, request_data: dict) -> Dict[str, Any]:
         is_valid, error_message = self._validate_booking_request(request_data)
         if not is_valid:
             return self._create_error_response("VALIDATION_ERROR", error_message)
 
-        if not self._check_seat_availability(request_data["seat_number"]):
+        if not await self._check_seat_availability(request_data["seat_number"]):
             return self._create_error_response("SEAT_UNAVAILABLE", "Seat is not available")
 
         booking_reference = str(uuid.uuid4())
@@ -96,34 +103,105 @@ class TicketService:
         }
 
         try:
-            ticket = self.repository.create_ticket(ticket_data)
+            ticket = await self.repository.create_ticket(ticket_data)
+        except IntegrityError:
+            # A concurrent booking took the seat after the availability check
+            await self.repository.rollback()
+            return self._create_error_response("SEAT_UNAVAILABLE", "Seat is not available")
+        except Exception:
+            await self.repository.rollback()
+            raise
+
+        try:
             response = self._create_ticket_response(ticket, booking_reference)
 
-            self._save_booking_data(request_id, request_data, response)
+            await self._save_booking_data(request_id, request_data, response)
             return response
 
         except Exception as e:
-            self.repository.session.rollback()
+            await self.repository.rollback()
             raise
 
-    def _save_booking_data(self, request_id: str, request_data: dict, response: Dict[str, Any]) -> None:
-        self.repository.save_booking_response(request_id, response)
-        self.cache.cache_request(request_id, request_data)
+    async def _save_booking_data(self, request_id: str, request_data: dict, response: Dict[str, Any]) -> None:
+        await self.repository.save_booking_response(request_id, response)
+        await self.cache.cache_request(request_id, request_data)
+
+    async def _wait_for_in_progress_request(self, request_id: str, deadline: float) -> Optional[dict]:
+        while time.monotonic() < deadline:
+            if not await self.cache.is_request_in_progress(request_id):
+                return await self.cache.get_cached_request(request_id)
+            await asyncio.sleep(settings.COALESCE_POLL_INTERVAL)
+
+        raise SingleFlightTimeout(f"Timed out waiting for in-flight request {request_id}")
+
+    async def _process_marked_booking(self, request_id: str, request_data: dict) -> Dict[str, Any]:
+        deadline = time.monotonic() + settings.COALESCE_WAIT_TIMEOUT
+        waited = False
+        while True:
+            marker = await self.cache.mark_request_in_progress(request_id)
+            if marker:
+                break
+
+            # Another worker owns this request_id; wait for its cached result
+            if self.single_flight and not waited:
+                self.single_flight.record_coalesced()
+            waited = True
+
+            cached_request = await self._wait_for_in_progress_request(request_id, deadline)
+            if cached_request:
+                return await self._handle_duplicate_request(request_id, request_data, cached_request)
+            # The owner finished without caching a booking, so try to take over;
+            # another waiter may get there first, in which case wait on it instead
 
-    def book_ticket(self, request_id: str, request_data: dict) -> Dict[str, Any]:
         try:
-            cached_request = self.cache.get_cached_request(request_id)
+            # The previous owner may have finished after book_ticket checked the cache
+            cached_request = await self.cache.get_cached_request(request_id)
             if cached_request:
-                return self._handle_duplicate_request(request_id, request_data, cached_request)
+                return await self._handle_duplicate_request(request_id, request_data, cached_request)
 
-            return self._process_new_booking(request_id, request_data)
+            return await self._process_new_booking(request_id, request_data)
+        finally:
+            await self.cache.clear_request_in_progress(request_id, marker)
 
+    async def book_ticket(self, request_id: str, request_data: dict) -> Dict[str, Any]:
+        try:
+            cached_request = await self.cache.get_cached_request(request_id)
+            if cached_request:
+                return await self._handle_duplicate_request(request_id, request_data, cached_request)
+
+            if not self.single_flight:
+                return await self._process_marked_booking(request_id, request_data)
+
+            flight_key = f"{request_id}:{self.cache.generate_request_hash(request_data)}"
+            return await self.single_flight.do(
+                flight_key,
+                lambda: self._process_marked_booking(request_id, request_data)
+            )
+
+        except SingleFlightTimeout:
+            return self._create_error_response(
+                "REQUEST_IN_PROGRESS",
+                "An identical request is still being processed, please retry"
+            )
         except Exception as e:
             return self._create_error_response(
                 "INTERNAL_ERROR",
                 f"An error occurred: {str(e)}"
             )
 
+    async def get_ticket_details(self, booking_reference: str):
+        return await self.repository.get_ticket(booking_reference)
+
+    async def get_list_of_tickets(self, pagination: PaginationParams) -> PaginatedResponse:
+        tickets, total = await self.repository.get_tickets_paginated(pagination.page, pagination.size)
+        return PaginatedResponse(
+            items=[TicketResponse.model_validate(ticket) for ticket in tickets],
+            total=total,
+            page=pagination.page,
+            size=pagination.size,
+            pages=(total + pagination.size - 1) // pagination.size
+        )
+
     def _get_ticket_details_response(self, ticket) -> Dict[str, Any]:
         return {
             "status": "SUCCESS",
@@ -137,8 +215,8 @@ class TicketService:
             }
         }
 
-    def cancel_ticket(self, booking_reference: str) -> Dict[str, Any]:
-        ticket = self.repository.get_ticket(booking_reference)
+    async def cancel_ticket(self, booking_reference: str) -> Dict[str, Any]:
+        ticket = await self.repository.get_ticket(booking_reference)
         if not ticket:
             return self._create_error_response("TICKET_NOT_FOUND", "Ticket not found")
 
@@ -148,7 +226,7 @@ class TicketService:
                 "Ticket is already cancelled"
             )
 
-        updated_ticket = self.repository.update_ticket_status(
+        updated_ticket = await self.repository.update_ticket_status(
             booking_reference,
             TicketStatus.CANCELLED
         )
@@ -1,5 +1,5 @@
 import pytest
-from unittest.mock import Mock, MagicMock
+from unittest.mock import AsyncMock, Mock, MagicMock
 from app.repositories.ticket_repository import TicketRepository
 from app.cache.redis_cache import RedisCache
 from app.services.ticket_service import TicketService
@@ -8,10 +8,10 @@ from app.services.ticket_service import TicketService
 @pytest.fixture
 def mock_repository():
     repository = Mock(spec=TicketRepository)
-    repository.get_all_tickets = MagicMock(return_value=[])
-    repository.create_ticket = MagicMock()
-    repository.get_ticket = MagicMock()
-    repository.update_ticket_status = MagicMock()
+    repository.get_booked_ticket_by_seat = AsyncMock(return_value=None)
+    repository.create_ticket = AsyncMock()
+    repository.get_ticket = AsyncMock()
+    repository.update_ticket_status = AsyncMock()
     return repository
 
 
@@ -19,9 +19,9 @@ def mock_repository():
 def mock_cache():
     cache = Mock(spec=RedisCache)
     cache.redis = Mock()
-    cache.redis.hgetall = MagicMock(return_value={})
-    cache.redis.hset = MagicMock()
-    cache.redis.expire = MagicMock()
+    cache.redis.hgetall = AsyncMock(return_value={})
+    cache.redis.hset = AsyncMock()
+    cache.redis.expire = AsyncMock()
     cache.generate_request_hash = MagicMock(return_value="test-hash")
     return cache
 
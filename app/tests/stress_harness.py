@@ -0,0 +1,424 @@
+"""Contention stress harness for the booking path.
+
+Drives the real TicketService, RedisCache and SingleFlight from many concurrent
+tasks against in-memory stand-ins for Postgres and Redis. Seats are picked from a
+Zipfian distribution so a handful of hot seats take most of the traffic. With
+``--database-url`` the same plan runs against the SQLAlchemy TicketRepository,
+so the real ``uq_tickets_booked_seat`` index settles seat races.
+
+Usage:
+    python -m app.tests.stress_harness --operations 20000 --clients 200 --seats 50
+    python -m app.tests.stress_harness --database-url sqlite+aiosqlite:///stress.db
+"""
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from types import SimpleNamespace
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import time
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.future import select
+from sqlalchemy.orm import sessionmaker
+from app.cache.redis_cache import RELEASE_IN_PROGRESS_SCRIPT, RedisCache
+from app.models.ticket import Base, Ticket, TicketStatus
+from app.repositories.ticket_repository import TicketRepository
+from app.services.retention_service import RetentionService
+from app.services.single_flight import SingleFlight
+from app.services.ticket_service import TicketService
+
+
+class InMemoryRedis:
+    """The subset of the redis client used by RedisCache.
+
+    ``latency`` sleeps on every call, like InMemoryTicketRepository.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self._data: Dict[str, Any] = {}
+
+    async def _round_trip(self) -> None:
+        if self.latency:
+            await asyncio.sleep(random.uniform(0, 2 * self.latency))
+
+    async def hgetall(self, key: str) -> Dict[bytes, bytes]:
+        await self._round_trip()
+        return dict(self._data.get(key, {}))
+
+    async def hset(self, key: str, mapping: Dict[str, str]) -> None:
+        await self._round_trip()
+        self._data.setdefault(key, {}).update(
+            {k.encode(): str(v).encode() for k, v in mapping.items()}
+        )
+
+    async def expire(self, key: str, ttl: int) -> None:
+        pass
+
+    async def set(self, key: str, value, nx: bool = False, ex: Optional[int] = None) -> bool:
+        await self._round_trip()
+        if nx and key in self._data:
+            return False
+        self._data[key] = value
+        return True
+
+    async def exists(self, key: str) -> int:
+        await self._round_trip()
+        return int(key in self._data)
+
+    async def delete(self, key: str) -> None:
+        await self._round_trip()
+        self._data.pop(key, None)
+
+    async def eval(self, script: str, numkeys: int, *keys_and_args) -> int:
+        # Only RedisCache's compare-and-delete script is emulated
+        if script != RELEASE_IN_PROGRESS_SCRIPT:
+            raise NotImplementedError("InMemoryRedis only runs RELEASE_IN_PROGRESS_SCRIPT")
+        await self._round_trip()
+        key, token = keys_and_args
+        if self._data.get(key) != token:
+            return 0
+        del self._data[key]
+        return 1
+
+
+class InMemoryTicketRepository:
+    """In-memory stand-in for TicketRepository.
+
+    Every call sleeps a jittered ``latency`` on average to model a database
+    round trip, which widens and reorders race windows the way a real network
+    hop would. The booked-seat check mirrors the ``uq_tickets_booked_seat``
+    index.
+    """
+
+    def __init__(self, latency: float = 0.0, enforce_booked_seat_unique: bool = True):
+        self.latency = latency
+        self.enforce_booked_seat_unique = enforce_booked_seat_unique
+        self._ids = itertools.count(1)
+        self.tickets: Dict[str, SimpleNamespace] = {}
+        self.responses: Dict[str, SimpleNamespace] = {}
+
+    async def _round_trip(self) -> None:
+        if self.latency:
+            await asyncio.sleep(random.uniform(0, 2 * self.latency))
+
+    async def get_booked_ticket_by_seat(self, seat_number: str) -> Optional[SimpleNamespace]:
+        await self._round_trip()
+        return next((
+            ticket for ticket in self.tickets.values()
+            if ticket.seat_number == seat_number and ticket.status == TicketStatus.BOOKED
+        ), None)
+
+    async def create_ticket(self, ticket_data: dict) -> SimpleNamespace:
+        await self._round_trip()
+        if self.enforce_booked_seat_unique and any(
+            ticket.seat_number == ticket_data["seat_number"] and ticket.status == TicketStatus.BOOKED
+            for ticket in self.tickets.values()
+        ):
+            raise IntegrityError("INSERT INTO tickets", ticket_data, Exception("uq_tickets_booked_seat"))
+        ticket = SimpleNamespace(id=next(self._ids), **ticket_data)
+        self.tickets[ticket.booking_reference] = ticket
+        return ticket
+
+    async def get_ticket(self, booking_reference: str) -> Optional[SimpleNamespace]:
+        await self._round_trip()
+        return self.tickets.get(booking_reference)
+
+    async def update_ticket_status(self, booking_reference: str, status: TicketStatus) -> Optional[SimpleNamespace]:
+        await self._round_trip()
+        ticket = self.tickets.get(booking_reference)
+        if ticket:
+            ticket.status = status
+        return ticket
+
+    async def save_booking_response(self, request_id: str, response: dict) -> SimpleNamespace:
+        await self._round_trip()
+        booking_response = SimpleNamespace(request_id=request_id, response_data=json.loads(json.dumps(response)))
+        self.responses[request_id] = booking_response
+        return booking_response
+
+    async def get_booking_response(self, request_id: str) -> Optional[SimpleNamespace]:
+        await self._round_trip()
+        return self.responses.get(request_id)
+
+    async def rollback(self) -> None:
+        pass
+
+
+@dataclass
+class StressConfig:
+    operations: int = 2000
+    clients: int = 32
+    workers: int = 2  # app processes, each with its own SingleFlight
+    seats: int = 20
+    zipf_exponent: float = 1.2
+    cancel_ratio: float = 0.1
+    replay_ratio: float = 0.3
+    replay_window: int = 16  # replays retry one of the most recent bookings
+    latency: float = 0.001
+    seed: int = 42
+    enforce_booked_seat_unique: bool = True  # in-memory runs only
+    # Run against TicketRepository on this database, which is dropped and recreated
+    database_url: Optional[str] = None
+
+
+@dataclass
+class StressReport:
+    operations: int = 0
+    duration: float = 0.0
+    bookings: int = 0
+    replays: int = 0
+    cancels: int = 0
+    conflicts: int = 0
+    coalesced: int = 0
+    codes: Dict[str, int] = field(default_factory=dict)
+    latencies: Dict[str, Dict[str, float]] = field(default_factory=dict)
+    violations: List[str] = field(default_factory=list)
+
+    @property
+    def throughput(self) -> float:
+        return self.operations / self.duration if self.duration else 0.0
+
+    @property
+    def conflict_rate(self) -> float:
+        return self.conflicts / self.bookings if self.bookings else 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "operations": self.operations,
+            "duration": round(self.duration, 3),
+            "throughput": round(self.throughput, 1),
+            "bookings": self.bookings,
+            "replays": self.replays,
+            "cancels": self.cancels,
+            "conflict_rate": round(self.conflict_rate, 4),
+            "coalesced": self.coalesced,
+            "codes": self.codes,
+            "latencies_ms": self.latencies,
+            "violations": self.violations
+        }
+
+
+def _percentile(samples: List[float], percentile: float) -> float:
+    ordered = sorted(samples)
+    index = max(0, int(round(percentile / 100 * len(ordered))) - 1)
+    return ordered[index]
+
+
+def _zipf_weights(count: int, exponent: float) -> List[float]:
+    return [1 / rank ** exponent for rank in range(1, count + 1)]
+
+
+def _plan(config: StressConfig) -> List[Dict[str, Any]]:
+    """Builds the operation list up front so a seed reproduces a run."""
+    rng = random.Random(config.seed)
+    seats = [f"A{number}" for number in range(1, config.seats + 1)]
+    weights = _zipf_weights(config.seats, config.zipf_exponent)
+    issued: List[Dict[str, Any]] = []
+    plan = []
+
+    for number in range(config.operations):
+        roll = rng.random()
+        if roll < config.cancel_ratio:
+            plan.append({"kind": "cancel"})
+        elif roll < config.cancel_ratio + config.replay_ratio and issued:
+            plan.append({**rng.choice(issued[-config.replay_window:]), "kind": "replay"})
+        else:
+            booking = {
+                "kind": "book",
+                "request_id": f"stress_{number}",
+                "request_data": {
+                    "passenger_name": f"Passenger {number}",
+                    "seat_number": rng.choices(seats, weights)[0],
+                    "amount": 100.0
+                }
+            }
+            issued.append(booking)
+            plan.append(booking)
+    return plan
+
+
+def run_stress(config: StressConfig) -> StressReport:
+    return asyncio.run(_run_stress(config))
+
+
+async def _create_database(database_url: str) -> sessionmaker:
+    engine = create_async_engine(database_url)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+    session_factory = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    # Stored responses need today's partition on Postgres
+    await RetentionService(session_factory).prepare_partitions()
+    return session_factory
+
+
+async def _run_stress(config: StressConfig) -> StressReport:
+    if config.database_url:
+        session_factory = await _create_database(config.database_url)
+    else:
+        in_memory = InMemoryTicketRepository(config.latency, config.enforce_booked_seat_unique)
+
+    @asynccontextmanager
+    async def open_repository() -> AsyncIterator[Any]:
+        if not config.database_url:
+            yield in_memory
+            return
+        # A session per operation, like the router's get_db dependency
+        async with session_factory() as session:
+            yield TicketRepository(session)
+
+    cache = RedisCache(InMemoryRedis(config.latency))
+    single_flights = [SingleFlight() for _ in range(config.workers)]
+    plan = _plan(config)
+    rng = random.Random(config.seed + 1)
+    clients = asyncio.Semaphore(config.clients)
+    booked_references: List[str] = []
+    results: List[Dict[str, Any]] = []
+
+    async def execute(index: int, operation: Dict[str, Any]) -> None:
+        async with clients, open_repository() as repository:
+            service = TicketService(repository, cache, single_flights[index % config.workers])
+            started = time.perf_counter()
+
+            if operation["kind"] == "cancel":
+                reference = rng.choice(booked_references) if booked_references else None
+                response = await service.cancel_ticket(reference) if reference else None
+            else:
+                response = await service.book_ticket(operation["request_id"], operation["request_data"])
+                if response.get("code") == "BOOKING_CREATED":
+                    booked_references.append(response["booking_reference"])
+
+            completed = time.perf_counter()
+        if response is not None:
+            results.append({
+                **operation,
+                "response": response,
+                "started": started,
+                "completed": completed,
+                "elapsed": completed - started
+            })
+
+    started = time.perf_counter()
+    await asyncio.gather(*(execute(index, operation) for index, operation in enumerate(plan)))
+    duration = time.perf_counter() - started
+
+    if config.database_url:
+        async with session_factory() as session:
+            tickets = (await session.execute(select(Ticket))).scalars().all()
+        await session_factory.kw["bind"].dispose()
+    else:
+        tickets = list(in_memory.tickets.values())
+
+    return _build_report(results, tickets, single_flights, duration)
+
+
+def _build_report(
+        results: List[Dict[str, Any]],
+        tickets: Iterable[Any],
+        single_flights: List[SingleFlight],
+        duration: float
+) -> StressReport:
+    report = StressReport(operations=len(results), duration=duration)
+    report.coalesced = sum(single_flight.coalesced_count for single_flight in single_flights)
+    samples: Dict[str, List[float]] = {}
+    attempts: Dict[str, List[Dict[str, Any]]] = {}
+
+    for result in results:
+        kind = result["kind"]
+        code = result["response"].get("code", "")
+        report.codes[code] = report.codes.get(code, 0) + 1
+        samples.setdefault(kind, []).append(result["elapsed"] * 1000)
+
+        if kind == "cancel":
+            report.cancels += 1
+            continue
+        if kind == "book":
+            report.bookings += 1
+            if code == "SEAT_UNAVAILABLE":
+                report.conflicts += 1
+        else:
+            report.replays += 1
+        attempts.setdefault(result["request_id"], []).append(result)
+
+    report.latencies = {
+        kind: {
+            "p50": round(_percentile(values, 50), 3),
+            "p95": round(_percentile(values, 95), 3),
+            "p99": round(_percentile(values, 99), 3)
+        }
+        for kind, values in samples.items()
+    }
+
+    booked_per_seat: Dict[str, int] = {}
+    for ticket in tickets:
+        if ticket.status == TicketStatus.BOOKED:
+            booked_per_seat[ticket.seat_number] = booked_per_seat.get(ticket.seat_number, 0) + 1
+    for seat, count in sorted(booked_per_seat.items()):
+        if count > 1:
+            report.violations.append(f"Seat {seat} has {count} BOOKED tickets")
+
+    booked_references = set()
+    succeeded_requests = 0
+    for request_id, request_attempts in sorted(attempts.items()):
+        succeeded = [attempt for attempt in request_attempts if attempt["response"].get("status") == "SUCCESS"]
+        if not succeeded:
+            continue
+        original = min(succeeded, key=lambda attempt: attempt["completed"])
+        succeeded_requests += 1
+        booked_references.add(original["response"]["booking_reference"])
+
+        if any(attempt["response"] != original["response"] for attempt in succeeded):
+            report.violations.append(f"Replays of {request_id} returned different responses")
+        # Once the booking has succeeded every later answer must be the stored
+        # response; an earlier failed attempt always completes before it
+        late = [
+            attempt["response"].get("code") for attempt in request_attempts
+            if attempt["completed"] > original["completed"] and attempt["response"] != original["response"]
+        ]
+        if late:
+            report.violations.append(
+                f"{len(late)} attempts at {request_id} completing after it succeeded returned {sorted(set(late))}"
+            )
+    if len(booked_references) != succeeded_requests:
+        report.violations.append("Different requests share a booking_reference")
+
+    for code in ("INTERNAL_ERROR", "REQUEST_IN_PROGRESS"):
+        if report.codes.get(code):
+            report.violations.append(f"{report.codes[code]} responses failed with {code}")
+
+    return report
+
+
+def main() -> None:
+    defaults = StressConfig()
+    parser = argparse.ArgumentParser(description="Hot-seat booking stress test")
+    parser.add_argument("--operations", type=int, default=defaults.operations)
+    parser.add_argument("--clients", type=int, default=defaults.clients)
+    parser.add_argument("--workers", type=int, default=defaults.workers)
+    parser.add_argument("--seats", type=int, default=defaults.seats)
+    parser.add_argument("--zipf-exponent", type=float, default=defaults.zipf_exponent)
+    parser.add_argument("--cancel-ratio", type=float, default=defaults.cancel_ratio)
+    parser.add_argument("--replay-ratio", type=float, default=defaults.replay_ratio)
+    parser.add_argument("--replay-window", type=int, default=defaults.replay_window)
+    parser.add_argument("--latency", type=float, default=defaults.latency, help="seconds per store call")
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+    parser.add_argument(
+        "--no-seat-constraint",
+        dest="enforce_booked_seat_unique",
+        action="store_false",
+        help="do not emulate the uq_tickets_booked_seat index"
+    )
+    parser.add_argument("--database-url", help="run against TicketRepository on this database; it is recreated")
+    report = run_stress(StressConfig(**vars(parser.parse_args())))
+
+    print(json.dumps(report.to_dict(), indent=2))
+    raise SystemExit(1 if report.violations else 0)
+
+
+if __name__ == "__main__":
+    main()
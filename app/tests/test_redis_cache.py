@@ -0,0 +1,32 @@
+import os
+import pytest
+import pytest_asyncio
+import redis.asyncio as redis
+from app.cache.redis_cache import RedisCache
+
+
+@pytest_asyncio.fixture
+async def redis_cache():
+    if not os.getenv("TEST_REDIS_URL"):
+        pytest.skip("TEST_REDIS_URL is not set")
+    client = redis.from_url(os.environ["TEST_REDIS_URL"])
+    await client.delete("request:marked:in_progress")
+    yield RedisCache(client)
+    await client.delete("request:marked:in_progress")
+    await client.aclose()
+
+
+@pytest.mark.asyncio
+async def test_clear_request_in_progress_keeps_a_newer_owners_marker(redis_cache):
+    stale_token = await redis_cache.mark_request_in_progress("marked")
+    assert stale_token
+    assert await redis_cache.mark_request_in_progress("marked") is None
+
+    # The first owner outlives the marker TTL and another worker takes over
+    await redis_cache.redis.delete("request:marked:in_progress")
+    token = await redis_cache.mark_request_in_progress("marked")
+
+    assert not await redis_cache.clear_request_in_progress("marked", stale_token)
+    assert await redis_cache.is_request_in_progress("marked")
+    assert await redis_cache.clear_request_in_progress("marked", token)
+    assert not await redis_cache.is_request_in_progress("marked")
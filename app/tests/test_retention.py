@@ -0,0 +1,247 @@
+from datetime import datetime, timedelta
+import asyncio
+import os
+import pytest
+import pytest_asyncio
+from sqlalchemy import func, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.future import select
+from sqlalchemy.orm import sessionmaker
+from app.core.config import settings
+from app.models.ticket import Base, BookingRequestKey, BookingResponse, Ticket, TicketArchive, TicketStatus
+from app.repositories.retention_repository import RetentionRepository
+from app.repositories.ticket_repository import TicketRepository
+from app.services.retention_service import RetentionService
+
+NOW = datetime(2024, 6, 1, 12, 0, 0)
+
+
+@pytest_asyncio.fixture
+async def session_factory(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'retention.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    yield sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    await engine.dispose()
+
+
+@pytest_asyncio.fixture
+async def postgres_session_factory():
+    if not os.getenv("TEST_POSTGRES_URL"):
+        pytest.skip("TEST_POSTGRES_URL is not set")
+    engine = create_async_engine(os.environ["TEST_POSTGRES_URL"])
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+    yield sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    await engine.dispose()
+
+
+async def _count(session_factory, model) -> int:
+    async with session_factory() as session:
+        return await session.scalar(select(func.count()).select_from(model))
+
+
+@pytest.mark.asyncio
+async def test_purge_booking_responses_keeps_recent_rows(session_factory):
+    async with session_factory() as session:
+        for i in range(5):
+            session.add(BookingResponse(
+                request_id=f"old_{i}",
+                response_data={"status": "SUCCESS"},
+                created_at=NOW - timedelta(days=7)
+            ))
+        session.add(BookingResponse(
+            request_id="recent",
+            response_data={"status": "SUCCESS"},
+            created_at=NOW - timedelta(minutes=5)
+        ))
+        await session.commit()
+
+    service = RetentionService(session_factory, batch_size=2, batch_pause=0)
+    purged = await service.purge_booking_responses(NOW)
+
+    assert purged == 5
+    async with session_factory() as session:
+        remaining = (await session.execute(select(BookingResponse))).scalars().all()
+    assert [row.request_id for row in remaining] == ["recent"]
+    assert remaining[0].response_data == {"status": "SUCCESS"}
+
+
+@pytest.mark.asyncio
+async def test_archive_cancelled_tickets_moves_only_old_cancellations(session_factory):
+    async with session_factory() as session:
+        for i in range(3):
+            session.add(Ticket(
+                booking_reference=f"REF-OLD-{i}",
+                passenger_name="John Doe",
+                seat_number=f"A{i}",
+                amount=100.0,
+                status=TicketStatus.CANCELLED,
+                updated_at=NOW - timedelta(days=60)
+            ))
+        session.add(Ticket(
+            booking_reference="REF-RECENT",
+            passenger_name="John Doe",
+            seat_number="B1",
+            amount=100.0,
+            status=TicketStatus.CANCELLED,
+            updated_at=NOW - timedelta(days=1)
+        ))
+        session.add(Ticket(
+            booking_reference="REF-BOOKED",
+            passenger_name="John Doe",
+            seat_number="B2",
+            amount=100.0,
+            status=TicketStatus.BOOKED,
+            updated_at=NOW - timedelta(days=60)
+        ))
+        await session.commit()
+
+    service = RetentionService(session_factory, batch_size=2, batch_pause=0)
+    archived = await service.archive_cancelled_tickets(NOW)
+
+    assert archived == 3
+    assert await _count(session_factory, Ticket) == 2
+    async with session_factory() as session:
+        archive = (await session.execute(select(TicketArchive))).scalars().all()
+    assert sorted(row.booking_reference for row in archive) == ["REF-OLD-0", "REF-OLD-1", "REF-OLD-2"]
+    assert all(row.archived_at is not None for row in archive)
+
+
+@pytest.mark.asyncio
+async def test_archive_cancelled_tickets_resumes_after_last_archived_id(session_factory):
+    async with session_factory() as session:
+        for i in range(4):
+            session.add(Ticket(
+                booking_reference=f"REF-OLD-{i}",
+                passenger_name="John Doe",
+                seat_number=f"A{i}",
+                amount=100.0,
+                status=TicketStatus.CANCELLED,
+                updated_at=NOW - timedelta(days=60)
+            ))
+        await session.commit()
+
+    cutoff = NOW - timedelta(days=30)
+    async with session_factory() as session:
+        first = await RetentionRepository(session).archive_cancelled_tickets_before(cutoff, 2)
+    async with session_factory() as session:
+        second = await RetentionRepository(session).archive_cancelled_tickets_before(cutoff, 2, after=first[-1])
+    async with session_factory() as session:
+        rest = await RetentionRepository(session).archive_cancelled_tickets_before(cutoff, 2, after=second[-1])
+
+    assert first == [1, 2]
+    assert second == [3, 4]
+    assert rest == []
+
+
+@pytest.mark.asyncio
+async def test_save_booking_response_rejects_duplicate_request_id(session_factory):
+    async with session_factory() as session:
+        await TicketRepository(session).save_booking_response("dup", {"status": "SUCCESS"})
+
+    async with session_factory() as session:
+        with pytest.raises(IntegrityError):
+            await TicketRepository(session).save_booking_response("dup", {"status": "ERROR"})
+
+    async with session_factory() as session:
+        stored = await TicketRepository(session).get_booking_response("dup")
+    assert stored.response_data == {"status": "SUCCESS"}
+
+
+@pytest.mark.asyncio
+async def test_get_booking_response_returns_original_when_request_id_repeats(session_factory):
+    async with session_factory() as session:
+        session.add(BookingResponse(request_id="dup", response_data={"n": 1}, created_at=NOW))
+        session.add(BookingResponse(request_id="dup", response_data={"n": 2}, created_at=NOW + timedelta(days=1)))
+        await session.commit()
+
+    async with session_factory() as session:
+        stored = await TicketRepository(session).get_booking_response("dup")
+    assert stored.response_data == {"n": 1}
+
+
+@pytest.mark.asyncio
+async def test_purge_booking_responses_expires_request_keys(session_factory):
+    async with session_factory() as session:
+        session.add(BookingRequestKey(request_id="old", created_at=NOW - timedelta(days=7)))
+        session.add(BookingRequestKey(request_id="recent", created_at=NOW - timedelta(minutes=5)))
+        await session.commit()
+
+    await RetentionService(session_factory, batch_size=1, batch_pause=0).purge_booking_responses(NOW)
+
+    async with session_factory() as session:
+        keys = (await session.execute(select(BookingRequestKey.request_id))).scalars().all()
+    assert keys == ["recent"]
+
+
+@pytest.mark.asyncio
+async def test_postgres_partitions_are_detached_and_dropped(postgres_session_factory):
+    async with postgres_session_factory() as session:
+        await RetentionRepository(session).ensure_booking_response_partitions(
+            (NOW - timedelta(days=4)).date(), 5
+        )
+        for days_ago in range(5):
+            session.add(BookingResponse(
+                request_id=f"request_{days_ago}",
+                response_data={"days_ago": days_ago},
+                created_at=NOW - timedelta(days=days_ago)
+            ))
+        session.add(BookingResponse(
+            request_id="request_3_again",
+            response_data={"days_ago": 3},
+            created_at=NOW - timedelta(days=3, hours=1)
+        ))
+        await session.commit()
+
+    await RetentionService(postgres_session_factory).prepare_partitions()
+    async with postgres_session_factory() as session:
+        await TicketRepository(session).save_booking_response("dup", {"status": "SUCCESS"})
+        # The key table keeps request_id unique across partitions
+        with pytest.raises(IntegrityError):
+            await TicketRepository(session).save_booking_response("dup", {"status": "SUCCESS"})
+
+    # Retention is one day, so the partitions for two or more days ago go
+    dropped = await RetentionService(postgres_session_factory).purge_booking_responses(NOW)
+
+    # Counted in rows, like the batched delete used elsewhere
+    assert dropped == 4
+    async with postgres_session_factory() as session:
+        partitions = (await session.execute(text(
+            "SELECT relname FROM pg_class WHERE relkind = 'r' AND relname LIKE 'booking\\_responses\\_%' ORDER BY relname"
+        ))).scalars().all()
+        remaining = (await session.execute(
+            select(BookingResponse.request_id).order_by(BookingResponse.request_id)
+        )).scalars().all()
+    assert partitions[:2] == [
+        f"booking_responses_{NOW - timedelta(days=1):%Y%m%d}",
+        f"booking_responses_{NOW:%Y%m%d}"
+    ]
+    assert remaining == ["dup", "request_0", "request_1"]
+
+
+@pytest.mark.asyncio
+async def test_concurrent_workers_prepare_partitions_once(postgres_session_factory):
+    services = [RetentionService(postgres_session_factory) for _ in range(4)]
+
+    # Unserialized, racing CREATE TABLE ... PARTITION OF statements can fail
+    await asyncio.gather(*(service.prepare_partitions(NOW) for service in services))
+
+    async with postgres_session_factory() as session:
+        partitions = await session.scalar(text(
+            "SELECT count(*) FROM pg_inherits "
+            "WHERE inhparent = 'booking_responses'::regclass"
+        ))
+    assert partitions == settings.BOOKING_RESPONSE_PARTITIONS_AHEAD
+
+
+@pytest.mark.asyncio
+async def test_run_once_skips_while_another_worker_holds_the_lock(postgres_session_factory):
+    async with postgres_session_factory() as session:
+        async with RetentionRepository(session).retention_lock() as acquired:
+            assert acquired
+            assert await RetentionService(postgres_session_factory).run_once(NOW) is None
+
+    assert await RetentionService(postgres_session_factory).run_once(NOW) is not None
@@ -0,0 +1,18 @@
+from fastapi.testclient import TestClient
+from app.core.config import settings
+from app.main import app
+from app.routers import ticket_router
+from app.services.single_flight import SingleFlight
+
+
+def test_metrics_reports_coalesced_requests(monkeypatch):
+    single_flight = SingleFlight()
+    single_flight.record_coalesced()
+    single_flight.record_coalesced()
+    monkeypatch.setattr(ticket_router, "booking_single_flight", single_flight)
+
+    # Without the context manager the lifespan, and so the retention loop, never starts
+    response = TestClient(app).get(f"{settings.API_V1_PREFIX}/metrics")
+
+    assert response.status_code == 200
+    assert response.json() == {"coalesced_requests": 2}
@@ -1,29 +1,35 @@
 from typing import Dict, Any
 import json
+import asyncio
 import pytest
-from unittest.mock import Mock, MagicMock
+from unittest.mock import AsyncMock, Mock, MagicMock
 from app.models.ticket import Ticket, TicketStatus
 from app.services.ticket_service import TicketService
+from app.services.single_flight import SingleFlight
 
 
 @pytest.fixture
 def mock_cache():
     cache = Mock()
-    cache.get_cached_request = MagicMock(return_value=None)
+    cache.get_cached_request = AsyncMock(return_value=None)
     cache.generate_request_hash = MagicMock(return_value="test-hash")
-    cache.cache_request = MagicMock()
+    cache.cache_request = AsyncMock()
+    cache.mark_request_in_progress = AsyncMock(return_value="test-token")
+    cache.is_request_in_progress = AsyncMock(return_value=False)
+    cache.clear_request_in_progress = AsyncMock()
     return cache
 
 
 @pytest.fixture
 def mock_repository():
     repository = Mock()
-    repository.get_all_tickets = MagicMock(return_value=[])
-    repository.create_ticket = MagicMock()
-    repository.get_ticket = MagicMock()
-    repository.update_ticket_status = MagicMock()
-    repository.save_booking_response = MagicMock()
-    repository.get_booking_response = MagicMock()
+    repository.get_booked_ticket_by_seat = AsyncMock(return_value=None)
+    repository.create_ticket = AsyncMock()
+    repository.get_ticket = AsyncMock()
+    repository.update_ticket_status = AsyncMock()
+    repository.save_booking_response = AsyncMock()
+    repository.get_booking_response = AsyncMock()
+    repository.rollback = AsyncMock()
     repository.session = Mock()
     return repository
 
@@ -33,7 +39,8 @@ def service(mock_repository, mock_cache):
     return TicketService(mock_repository, mock_cache)
 
 
-def test_book_ticket_success(service, mock_repository, mock_cache):
+@pytest.mark.asyncio
+async def test_book_ticket_success(service, mock_repository, mock_cache):
     request_data = {
         "passenger_name": "John Doe",
         "seat_number": "A1",
@@ -42,14 +49,15 @@ def test_book_ticket_success(service, mock_repository, mock_cache):
 
     mock_cache.get_cached_request.return_value = None
 
-    result = service.book_ticket("request_1", request_data)
+    result = await service.book_ticket("request_1", request_data)
 
     assert result["status"] == "SUCCESS"
     assert "booking_reference" in result
     assert result["code"] == "BOOKING_CREATED"
 
 
-def test_book_ticket_duplicate_request_returns_original_response(service, mock_repository, mock_cache):
+@pytest.mark.asyncio
+async def test_book_ticket_duplicate_request_returns_original_response(service, mock_repository, mock_cache):
     request_data = {
         "passenger_name": "John Doe",
         "seat_number": "A2",
@@ -78,14 +86,15 @@ def test_book_ticket_duplicate_request_returns_original_response(service, mock_r
     mock_response.response_data = original_response
     mock_repository.get_booking_response.return_value = mock_response
 
-    result = service.book_ticket("request_2", request_data)
+    result = await service.book_ticket("request_2", request_data)
 
     assert result == original_response
     mock_cache.get_cached_request.assert_called_once_with("request_2")
     mock_repository.get_booking_response.assert_called_once_with("request_2")
 
 
-def test_book_ticket_duplicate_request_with_different_body(service, mock_cache):
+@pytest.mark.asyncio
+async def test_book_ticket_duplicate_request_with_different_body(service, mock_cache):
     original_request = {
         "passenger_name": "John Doe",
         "seat_number": "A2",
@@ -103,22 +112,131 @@ def test_book_ticket_duplicate_request_with_different_body(service, mock_cache):
         "data": original_request
     }
 
-    result = service.book_ticket("request_2", modified_request)
+    result = await service.book_ticket("request_2", modified_request)
 
     assert result["status"] == "ERROR"
     assert result["code"] == "INVALID_DUPLICATE_REQUEST"
     assert "Request body does not match" in result["message"]
 
 
-def test_book_ticket_invalid_request(service, mock_cache):
+@pytest.mark.asyncio
+async def test_book_ticket_invalid_request(service, mock_cache):
     request_data = {
         "passenger_name": "John Doe"  # Missing required fields
     }
 
     mock_cache.get_cached_request.return_value = None
 
-    result = service.book_ticket("request_4", request_data)
+    result = await service.book_ticket("request_4", request_data)
 
     assert result["status"] == "ERROR"
     assert result["code"] == "VALIDATION_ERROR"
     assert "Missing required field" in result["message"]
+
+
+@pytest.mark.asyncio
+async def test_book_ticket_concurrent_duplicates_are_coalesced(mock_repository, mock_cache):
+    request_data = {
+        "passenger_name": "John Doe",
+        "seat_number": "A5",
+        "amount": 100.0
+    }
+    single_flight = SingleFlight(wait_timeout=5)
+
+    async def slow_create_ticket(ticket_data):
+        await asyncio.sleep(0.2)
+        return Mock(**ticket_data)
+
+    mock_repository.create_ticket.side_effect = slow_create_ticket
+
+    async def book():
+        service = TicketService(mock_repository, mock_cache, single_flight)
+        return await service.book_ticket("request_5", request_data)
+
+    results = await asyncio.gather(*(book() for _ in range(5)))
+
+    assert mock_repository.create_ticket.call_count == 1
+    assert single_flight.coalesced_count == 4
+    assert all(result == results[0] for result in results)
+    assert results[0]["code"] == "BOOKING_CREATED"
+
+
+@pytest.mark.asyncio
+async def test_book_ticket_waits_for_request_in_progress_on_other_worker(service, mock_repository, mock_cache):
+    request_data = {
+        "passenger_name": "John Doe",
+        "seat_number": "A6",
+        "amount": 100.0
+    }
+    original_response = {"status": "SUCCESS", "code": "BOOKING_CREATED"}
+
+    mock_cache.get_cached_request.side_effect = [None, {"hash": "test-hash", "data": request_data}]
+    mock_cache.mark_request_in_progress.return_value = None
+    mock_cache.is_request_in_progress.side_effect = [True, False]
+    mock_repository.get_booking_response.return_value = Mock(response_data=original_response)
+
+    result = await service.book_ticket("request_6", request_data)
+
+    assert result == original_response
+    mock_repository.create_ticket.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_book_ticket_rechecks_cache_after_taking_marker(service, mock_repository, mock_cache):
+    request_data = {
+        "passenger_name": "John Doe",
+        "seat_number": "A8",
+        "amount": 100.0
+    }
+    original_response = {"status": "SUCCESS", "code": "BOOKING_CREATED"}
+
+    # The original finishes and clears its marker between the cache check and mark
+    mock_cache.get_cached_request.side_effect = [None, {"hash": "test-hash", "data": request_data}]
+    mock_cache.mark_request_in_progress.return_value = "token-8"
+    mock_repository.get_booking_response.return_value = Mock(response_data=original_response)
+
+    result = await service.book_ticket("request_8", request_data)
+
+    assert result == original_response
+    mock_repository.create_ticket.assert_not_called()
+    mock_cache.clear_request_in_progress.assert_called_once_with("request_8", "token-8")
+
+
+@pytest.mark.asyncio
+async def test_book_ticket_keeps_waiting_when_another_waiter_takes_over(service, mock_repository, mock_cache):
+    request_data = {
+        "passenger_name": "John Doe",
+        "seat_number": "A9",
+        "amount": 100.0
+    }
+
+    # The owner fails without caching, another waiter wins the marker, then also fails
+    mock_cache.get_cached_request.return_value = None
+    mock_cache.mark_request_in_progress.side_effect = [None, None, "token-9"]
+    mock_cache.is_request_in_progress.side_effect = [False, True, False]
+
+    result = await service.book_ticket("request_9", request_data)
+
+    assert result["code"] == "BOOKING_CREATED"
+    mock_repository.create_ticket.assert_called_once()
+    mock_cache.clear_request_in_progress.assert_called_once_with("request_9", "token-9")
+
+
+@pytest.mark.asyncio
+async def test_book_ticket_in_progress_wait_times_out(service, mock_repository, mock_cache, monkeypatch):
+    request_data = {
+        "passenger_name": "John Doe",
+        "seat_number": "A7",
+        "amount": 100.0
+    }
+    monkeypatch.setattr("app.services.ticket_service.settings.COALESCE_WAIT_TIMEOUT", 0.1)
+
+    mock_cache.get_cached_request.return_value = None
+    mock_cache.mark_request_in_progress.return_value = None
+    mock_cache.is_request_in_progress.return_value = True
+
+    result = await service.book_ticket("request_7", request_data)
+
+    assert result["status"] == "ERROR"
+    assert result["code"] == "REQUEST_IN_PROGRESS"
+    mock_repository.create_ticket.assert_not_called()
@@ -0,0 +1,267 @@
+from datetime import datetime, timedelta
+import asyncio
+import os
+import pytest
+import pytest_asyncio
+import redis.asyncio as redis
+from sqlalchemy.exc import IntegrityError, MultipleResultsFound
+from app.db.rebalance import copy_slot_range, delete_slot_range, move_slot_range
+from app.db.sharding import (
+    SHARD_MAP_ACK_PREFIX,
+    ShardMap,
+    ShardMapWatcher,
+    create_shard_sessions,
+    wait_for_shard_map_acknowledgements
+)
+from app.models.ticket import Base, TicketStatus
+from app.repositories.ticket_repository import ShardedTicketRepository, TicketRepository, _ticket_merge_key
+
+SHARDS = ["shard_a", "shard_b", "shard_c"]
+START = datetime(2024, 6, 1, 12, 0, 0)
+
+
+@pytest_asyncio.fixture
+async def shard_sessions(tmp_path):
+    sessions = create_shard_sessions({
+        name: f"sqlite+aiosqlite:///{tmp_path / name}.db" for name in SHARDS
+    })
+    for session_factory in sessions.values():
+        async with session_factory.kw["bind"].begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+    yield sessions
+    for session_factory in sessions.values():
+        await session_factory.kw["bind"].dispose()
+
+
+@pytest_asyncio.fixture
+async def repository(shard_sessions):
+    repository = ShardedTicketRepository(shard_sessions, ShardMap.even(SHARDS, slot_count=16))
+    for i in range(12):
+        await repository.create_ticket({
+            "booking_reference": f"REF-{i:02d}",
+            "passenger_name": "John Doe",
+            "seat_number": f"A{i}",
+            "amount": 100.0,
+            "status": TicketStatus.BOOKED,
+            "created_at": START + timedelta(minutes=i)
+        })
+    return repository
+
+
+@pytest_asyncio.fixture
+async def redis_client():
+    if not os.getenv("TEST_REDIS_URL"):
+        pytest.skip("TEST_REDIS_URL is not set")
+    client = redis.from_url(os.environ["TEST_REDIS_URL"])
+    yield client
+    async for key in client.scan_iter(match=f"{SHARD_MAP_ACK_PREFIX}*"):
+        await client.delete(key)
+    await client.aclose()
+
+
+def _seat(reference: str) -> str:
+    return f"A{int(reference.split('-')[1])}"
+
+
+async def _references_per_shard(repository):
+    return {
+        shard: sorted(ticket.booking_reference for ticket in await repository._on_shard(
+            shard, lambda shard_repository: shard_repository.get_tickets_ordered(100)
+        ))
+        for shard in SHARDS
+    }
+
+
+def test_shard_map_round_trip_and_assign():
+    shard_map = ShardMap.even(SHARDS, slot_count=12)
+    assert shard_map.to_dict()["ranges"] == [[0, 4, "shard_a"], [4, 8, "shard_b"], [8, 12, "shard_c"]]
+
+    shard_map.assign(2, 6, "shard_c")
+    restored = ShardMap.from_dict(shard_map.to_dict())
+
+    assert restored.slots == shard_map.slots
+    assert restored.version == shard_map.version == 1
+    assert restored.shard_for_key("REF-1") == shard_map.shard_for_key("REF-1")
+
+
+@pytest.mark.asyncio
+async def test_tickets_are_routed_by_seat_number(repository):
+    per_shard = await _references_per_shard(repository)
+
+    for shard, references in per_shard.items():
+        assert all(repository.shard_map.shard_for_key(_seat(reference)) == shard for reference in references)
+    assert sum(len(references) for references in per_shard.values()) == 12
+
+    await repository.update_ticket_status("REF-03", TicketStatus.CANCELLED)
+    ticket = await repository.get_ticket("REF-03")
+    assert ticket.status == TicketStatus.CANCELLED
+    assert await repository.get_booked_ticket_by_seat("A3") is None
+    assert (await repository.get_booked_ticket_by_seat("A4")).booking_reference == "REF-04"
+
+
+@pytest.mark.asyncio
+async def test_second_booking_of_a_seat_hits_the_same_shard_index(repository):
+    with pytest.raises(IntegrityError):
+        await repository.create_ticket({
+            "booking_reference": "REF-DUP",
+            "passenger_name": "Jane Doe",
+            "seat_number": "A5",
+            "amount": 100.0,
+            "status": TicketStatus.BOOKED
+        })
+
+
+@pytest.mark.asyncio
+async def test_get_ticket_by_id_refuses_ambiguous_ids(repository):
+    # Every shard numbers its own tickets from 1
+    with pytest.raises(MultipleResultsFound):
+        await repository.get_ticket_by_id(1)
+
+
+@pytest.mark.asyncio
+async def test_pagination_and_export_merge_across_shards(repository):
+    tickets, total = await repository.get_tickets_paginated(page=2, size=5)
+
+    assert total == 12
+    assert [ticket.booking_reference for ticket in tickets] == [f"REF-{i:02d}" for i in range(5, 10)]
+
+    cursor = _ticket_merge_key(tickets[-1])
+    next_page, _ = await repository.get_tickets_paginated(page=3, size=5, after=cursor)
+    assert [ticket.booking_reference for ticket in next_page] == ["REF-10", "REF-11"]
+
+    exported = [ticket.booking_reference async for ticket in repository.export_tickets(batch_size=2)]
+    assert exported == [f"REF-{i:02d}" for i in range(12)]
+
+
+async def _assert_all_readable(repository):
+    for i in range(12):
+        ticket = await repository.get_ticket(f"REF-{i:02d}")
+        assert ticket is not None and ticket.seat_number == f"A{i}"
+    assert (await repository.get_booking_response("request_1")).response_data == {"status": "SUCCESS"}
+    exported = [ticket.booking_reference async for ticket in repository.export_tickets()]
+    assert exported == [f"REF-{i:02d}" for i in range(12)]
+
+
+@pytest.mark.asyncio
+async def test_rebalance_keeps_every_key_readable_between_passes(repository, shard_sessions):
+    await repository.save_booking_response("request_1", {"status": "SUCCESS"})
+    shard_map = repository.shard_map
+    sources = {"shard_a", "shard_c"}
+
+    await copy_slot_range(shard_sessions, shard_map, 0, 16, "shard_b", sources)
+    await _assert_all_readable(repository)
+
+    shard_map.assign(0, 16, "shard_b")
+    await _assert_all_readable(repository)
+
+    # A change on the old owner that the first copy missed is carried over
+    async with shard_sessions["shard_a"]() as session:
+        for ticket in await TicketRepository(session).get_tickets_ordered(100):
+            ticket.status = TicketStatus.CANCELLED
+        await session.commit()
+    await copy_slot_range(shard_sessions, shard_map, 0, 16, "shard_b", sources)
+    await delete_slot_range(shard_sessions, shard_map, 0, 16, sources)
+    await _assert_all_readable(repository)
+
+    per_shard = await _references_per_shard(repository)
+    assert per_shard["shard_a"] == [] and per_shard["shard_c"] == []
+    moved_from_a = ShardMap.even(SHARDS, slot_count=16)
+    for i in range(12):
+        ticket = await repository.get_ticket(f"REF-{i:02d}")
+        expected = TicketStatus.CANCELLED if moved_from_a.shard_for_key(f"A{i}") == "shard_a" else TicketStatus.BOOKED
+        assert ticket.status == expected
+
+
+@pytest.mark.asyncio
+async def test_rebalance_moves_slot_range_to_target(repository, shard_sessions):
+    await repository.save_booking_response("request_1", {"status": "SUCCESS"})
+    slot = repository.shard_map.slot_for_key("request_1")
+    already_on_target = len((await _references_per_shard(repository))["shard_b"])
+
+    stats = await move_slot_range(shard_sessions, repository.shard_map, 0, 16, "shard_b", batch_size=3)
+
+    per_shard = await _references_per_shard(repository)
+    assert per_shard["shard_a"] == [] and per_shard["shard_c"] == []
+    assert len(per_shard["shard_b"]) == 12
+    assert repository.shard_map.shards == ["shard_b"]
+    assert stats["tickets"] == 12 - already_on_target
+    await _assert_all_readable(repository)
+    assert repository.shard_map.slots[slot] == "shard_b"
+
+
+@pytest.mark.asyncio
+async def test_worker_with_its_own_map_follows_a_rebalance(repository, shard_sessions, tmp_path):
+    await repository.save_booking_response("request_1", {"status": "SUCCESS"})
+    map_path = str(tmp_path / "shard_map.json")
+    repository.shard_map.save(map_path)
+    # The app worker loads its own copy of the map, apart from the rebalancer's
+    watcher = ShardMapWatcher(ShardMap.load(map_path), map_path, redis_client=None)
+    moved = next(
+        f"REF-{i:02d}" for i in range(12)
+        if watcher.shard_map.shard_for_key(f"A{i}") == "shard_a"
+    )
+
+    async def wait_for_workers(version):
+        # Until the worker reloads it still routes to the old owners
+        stale_worker = ShardedTicketRepository(shard_sessions, watcher.shard_map)
+        await _assert_all_readable(stale_worker)
+        await stale_worker.update_ticket_status(moved, TicketStatus.CANCELLED)
+
+        assert watcher.reload()
+        assert watcher.shard_map.version == version
+        await _assert_all_readable(ShardedTicketRepository(shard_sessions, watcher.shard_map))
+
+    await move_slot_range(
+        shard_sessions,
+        ShardMap.load(map_path),
+        0,
+        16,
+        "shard_b",
+        map_path=map_path,
+        wait_for_workers=wait_for_workers
+    )
+
+    worker = ShardedTicketRepository(shard_sessions, watcher.shard_map)
+    await _assert_all_readable(worker)
+    # The stale worker's write reached the new owner before the old copy went
+    assert (await worker.get_ticket(moved)).status == TicketStatus.CANCELLED
+    assert (await _references_per_shard(worker))["shard_a"] == []
+    with pytest.raises(IntegrityError):
+        await worker.create_ticket({
+            "booking_reference": "REF-DUP",
+            "passenger_name": "Jane Doe",
+            "seat_number": "A5",
+            "amount": 100.0,
+            "status": TicketStatus.BOOKED
+        })
+
+
+@pytest.mark.asyncio
+async def test_rebalancer_waits_for_every_worker_to_acknowledge(redis_client, tmp_path):
+    map_path = str(tmp_path / "shard_map.json")
+    ShardMap.even(SHARDS, slot_count=16).save(map_path)
+    workers = [
+        ShardMapWatcher(ShardMap.load(map_path), map_path, redis_client, worker_id=f"worker-{i}")
+        for i in range(2)
+    ]
+    for worker in workers:
+        await worker.acknowledge()
+
+    shard_map = ShardMap.load(map_path)
+    shard_map.assign(0, 4, "shard_b")
+    shard_map.save(map_path)
+
+    with pytest.raises(TimeoutError):
+        await wait_for_shard_map_acknowledgements(redis_client, shard_map.version, timeout=0.1, poll_interval=0.01)
+
+    waiting = asyncio.create_task(
+        wait_for_shard_map_acknowledgements(redis_client, shard_map.version, timeout=5, poll_interval=0.01)
+    )
+    assert workers[0].reload()
+    await workers[0].acknowledge()
+    await asyncio.sleep(0.1)
+    assert not waiting.done()
+
+    assert workers[1].reload()
+    await workers[1].acknowledge()
+    await asyncio.wait_for(waiting, 1)
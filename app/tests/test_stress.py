@@ -0,0 +1,79 @@
+import os
+import pytest
+from app.tests.stress_harness import StressConfig, _build_report, run_stress
+
+
+@pytest.fixture
+def database_url(tmp_path):
+    return os.getenv("TEST_POSTGRES_URL") or f"sqlite+aiosqlite:///{tmp_path / 'stress.db'}"
+
+
+# Races only show up on some interleavings, so a few seeds make the gate reliable
+@pytest.mark.parametrize("seed", [1, 2, 3, 4])
+def test_hot_seat_contention_keeps_booking_invariants(seed):
+    report = run_stress(StressConfig(operations=2000, clients=32, workers=2, seats=20, seed=seed))
+
+    assert report.violations == []
+    assert report.operations > 0
+    assert report.conflicts > 0
+    assert report.replays > 0
+
+
+# Same plan through TicketRepository, so the real unique index settles seat races
+@pytest.mark.parametrize("seed", [1, 2])
+def test_hot_seat_contention_keeps_booking_invariants_on_the_database(seed, database_url):
+    report = run_stress(StressConfig(
+        operations=600,
+        clients=16,
+        workers=2,
+        seats=10,
+        seed=seed,
+        database_url=database_url
+    ))
+
+    assert report.violations == []
+    assert report.codes.get("BOOKING_CREATED", 0) > 0
+    assert report.conflicts > 0
+    assert report.replays > 0
+
+
+def test_stress_plan_is_reproducible_for_a_seed():
+    config = StressConfig(operations=500, clients=1, workers=1, seats=5, latency=0)
+
+    first = run_stress(config)
+    second = run_stress(config)
+
+    assert first.codes == second.codes
+    assert first.violations == second.violations == []
+
+
+def test_harness_flags_double_booking_without_seat_constraint():
+    report = run_stress(StressConfig(
+        operations=1000,
+        clients=32,
+        seats=3,
+        latency=0.005,
+        cancel_ratio=0,  # a cancel could free one of the doubly booked tickets
+        enforce_booked_seat_unique=False
+    ))
+
+    assert any("BOOKED tickets" in violation for violation in report.violations)
+
+
+def test_report_flags_replay_that_differs_after_success():
+    booked = {"status": "SUCCESS", "code": "BOOKING_CREATED", "booking_reference": "REF-1"}
+    results = [
+        {"kind": "book", "request_id": "r1", "response": booked, "started": 0.0, "completed": 1.0, "elapsed": 1.0},
+        {
+            "kind": "replay",
+            "request_id": "r1",
+            "response": {"status": "ERROR", "code": "SEAT_UNAVAILABLE"},
+            "started": 2.0,
+            "completed": 2.5,
+            "elapsed": 0.5
+        },
+    ]
+
+    report = _build_report(results, [], [], duration=2.5)
+
+    assert report.violations == ["1 attempts at r1 completing after it succeeded returned ['SEAT_UNAVAILABLE']"]